@@ -1,17 +1,37 @@
 #!/usr/bin/env python
 import logging          as log
-from os                 import environ
+from os                 import environ, getpid, scandir, DirEntry
 from enum               import Enum, auto
 from argparse           import ArgumentParser, ArgumentDefaultsHelpFormatter, Namespace
 from pathlib            import Path
-from concurrent.futures import ThreadPoolExecutor
+from typing             import Iterable, Iterator, TextIO
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 from datetime           import datetime
+from contextlib         import contextmanager
+from functools          import lru_cache
+from threading          import Lock, Thread, current_thread
+from multiprocessing    import get_all_start_methods, get_context, parent_process
+from queue              import Queue
+from collections        import deque
+from fnmatch            import fnmatchcase
+from mmap               import mmap, ACCESS_READ
+from time               import perf_counter, time
 
 import re
 import sys
+import json
+import pickle
+import sqlite3
+import hashlib
+
+try:
+	import resource
+except ImportError:
+	resource = None
 
 import tatsu
-from jinja2             import Template, Environment
+from tatsu.exceptions   import FailedParse
+from jinja2             import Template, Environment, FileSystemLoader, FileSystemBytecodeCache
 from rich               import traceback
 from rich.logging       import RichHandler
 
@@ -20,23 +40,90 @@ from rich.logging       import RichHandler
 EXTRA_DIR         = (Path(__file__).parent / 'ext')
 
 TATSU_LEF_GRAMMAR = (EXTRA_DIR / 'lef.tatsu')
+TATSU_LEF_TOKENS  = (EXTRA_DIR / 'lef_tokens.tatsu')
 KISYM_TEMPLATE    = (EXTRA_DIR / 'kicad_sym.jinja')
 
-CELL_TEMPLATE_CELL  = (EXTRA_DIR / 'cell.jinja')
-CELL_TEMPLATE_NMOS3 = (EXTRA_DIR / 'nmos3.jinja')
-CELL_TEMPLATE_NMOS4 = (EXTRA_DIR / 'nmos4.jinja')
-CELL_TEMPLATE_PMOS3 = (EXTRA_DIR / 'pmos3.jinja')
-CELL_TEMPLATE_PMOS4 = (EXTRA_DIR / 'pmos4.jinja')
-
-env = Environment(trim_blocks = True, lstrip_blocks = True)
+CELL_TEMPLATE_CELL    = (EXTRA_DIR / 'cell.jinja')
+CELL_TEMPLATE_NMOS3   = (EXTRA_DIR / 'nmos3.jinja')
+CELL_TEMPLATE_NMOS4   = (EXTRA_DIR / 'nmos4.jinja')
+CELL_TEMPLATE_PMOS3   = (EXTRA_DIR / 'pmos3.jinja')
+CELL_TEMPLATE_PMOS4   = (EXTRA_DIR / 'pmos4.jinja')
+CELL_TEMPLATE_DERIVED = (EXTRA_DIR / 'derived.jinja')
+
+# All of the PDKs we know how to generate libraries for
+PDKS = (
+	'sky130A', 'sky130B',
+	'gf180mcuA', 'gf180mcuB', 'gf180mcuC', 'gf180mcuD'
+)
+
+# Libraries with more MACROs than this get broken up into multiple jobs
+LEF_CHUNK_MACROS    = 64
+MACRO_START_REGEX   = re.compile(rb'^[ \t]*MACRO[ \t]+(\S+)[ \t]*\r?$', re.MULTILINE)
+LEF_BLOCK_END_REGEX = re.compile(r'^[ \t]*END[ \t]*(#.*)?$')
+IDENT_HEAD_REGEX    = re.compile(r'\w*')
+SEXPR_TOKEN_REGEX   = re.compile(r'"(?:[^"\\]|\\.)*"|[()]|[^\s()"]+')
+SEXPR_EXTENDS_REGEX = re.compile(r'\(extends\s+"((?:[^"\\]|\\.)*)"\s*\)')
+SUBCKT_START_REGEX  = re.compile(rb'[ \t]*\.subckt(?:[ \t]+(\S+)|\s*$)', re.IGNORECASE)
+SUBCKT_END_REGEX    = re.compile(rb'[ \t]*\.ends(?:\s|$)', re.IGNORECASE)
+
+# The kinds of files `scan_pdk` picks up from each cell library, these are
+# both the name of the directory in the library and the suffix of the files
+INVENTORY_KINDS     = ( 'lef', 'spice', 'lib', 'gds' )
+
+# How many cell libraries each pipeline stage can get ahead of the next one
+PIPELINE_DEPTH      = 2
+
+# How many template chunks to batch up, and the size of the file buffer used when writing symbol libraries
+SYMLIB_STREAM_CHUNK = 16
+SYMLIB_WRITE_BUFFER = 1024 * 1024
+
+# Per output directory record of what went into each symbol library, used for `--skip-existing`.
+# These live in the cache rather than next to the symbol libraries, as they hold machine local file times.
+MANIFEST_DIR     = 'manifests'
+MANIFEST_OPTIONS = (
+	'pdk', 'ignore_pwr', 'dont_infer_pwr', 'split_char', 'dont_strip',
+	'keep_empty', 'flatten', 'spice', 'dont_link', 'compact', 'extends', 'cells', 'skip_cells',
+)
+
+# Where we stash things like the compiled LEF parser between runs
+CACHE_DIR = (Path(environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'pdk2kicad')
+
+# The database of already extracted MACROs keyed by LEF hash, bump the version whenever the schema changes.
+# It's also thrown away whenever the generator (this script, the grammars, or the templates) changes.
+MACRO_DB_NAME    = 'macros.sqlite'
+MACRO_DB_VERSION = 2
+
+# All of the templates are loaded and compiled once on first use and then kept around,
+# `auto_reload` is off so Jinja doesn't go and stat the template on every lookup either.
+env = Environment(
+	loader        = FileSystemLoader(EXTRA_DIR),
+	auto_reload   = False,
+	cache_size    = -1,
+	trim_blocks   = True,
+	lstrip_blocks = True,
+)
 env.globals['now'] = datetime.utcnow
 env.globals['len'] = len
 
 
+def setup_templates(args: Namespace) -> None:
+	CACHE: Path | None = args.cache_dir
+
+	if CACHE is not None:
+		JINJA_CACHE = (CACHE / 'jinja')
+		JINJA_CACHE.mkdir(exist_ok = True, parents = True)
+		env.bytecode_cache = FileSystemBytecodeCache(str(JINJA_CACHE))
+
+def get_template(template: Path) -> Template:
+	return env.get_template(template.name)
+
+
 def _setup_logging(args: Namespace = None) -> None:
 	level = log.INFO
 	if args is not None and args.verbose:
 		level = log.DEBUG
+	elif args is not None and args.quiet:
+		level = log.WARNING
 
 	log.basicConfig(
 		force    = True,
@@ -48,7 +135,165 @@ def _setup_logging(args: Namespace = None) -> None:
 		]
 	)
 
+class Profiler:
+	'''
+	Collects per-PDK and per-library timings for each stage of the generation along
+	with some basic counters, so we can see where all the time is going.
+	'''
+
+	STAGES = ( 'collect', 'parse', 'extract', 'layout', 'merge', 'render', 'write' )
+
+	def __init__(self) -> None:
+		self._lock = Lock()
+		self._start = perf_counter()
+		self.pdks: dict[str, dict] = dict()
+
+	def _entry(self, pdk: str, library: str | None) -> dict:
+		if pdk not in self.pdks:
+			self.pdks[pdk] = { 'stages': dict(), 'libraries': dict() }
+
+		if library is None:
+			return self.pdks[pdk]
+
+		libraries = self.pdks[pdk]['libraries']
+		if library not in libraries:
+			libraries[library] = {
+				'stages': dict(), 'cells': 0, 'pins': 0, 'bytes_in': 0, 'bytes_out': 0,
+				'layout_hits': 0, 'layout_misses': 0, 'fragment_hits': 0, 'fragment_misses': 0,
+				'parse_errors': list(),
+			}
+		return libraries[library]
+
+	def add(self, pdk: str, stage: str, elapsed: float, library: str | None = None) -> None:
+		with self._lock:
+			for entry in (self._entry(pdk, None), self._entry(pdk, library)) if library else (self._entry(pdk, None),):
+				entry['stages'][stage] = entry['stages'].get(stage, 0.0) + elapsed
+
+	def count(self, pdk: str, library: str, **counters: int) -> None:
+		with self._lock:
+			entry = self._entry(pdk, library)
+			for name, value in counters.items():
+				entry[name] += value
+
+	@contextmanager
+	def stage(self, pdk: str, stage: str, library: str | None = None):
+		start = perf_counter()
+		try:
+			yield
+		finally:
+			self.add(pdk, stage, perf_counter() - start, library)
+
+	def stage_summary(self, pdk: str) -> str:
+		stages = self._entry(pdk, None)['stages']
+		return ', '.join(f'{stage} {stages[stage]:.2f}s' for stage in self.STAGES if stage in stages)
+
+	def add_worker_spans(self, pdk: str, stage: str, spans: list[tuple[str, float, float]]) -> str:
+		'''
+		Record how busy each pool worker was from the (worker, start, elapsed) of each job they ran,
+		returning a summary of the utilization of each worker and how long the tail was.
+		'''
+
+		if len(spans) == 0:
+			return ''
+
+		begin = min(start for _, start, _ in spans)
+		end = max(start + elapsed for _, start, elapsed in spans)
+		wall = max(end - begin, 1e-9)
+
+		workers: dict[str, dict] = dict()
+		for worker, start, elapsed in spans:
+			entry = workers.setdefault(worker, { 'jobs': 0, 'busy': 0.0, 'finished': 0.0 })
+			entry['jobs'] += 1
+			entry['busy'] += elapsed
+			entry['finished'] = max(entry['finished'], start + elapsed - begin)
+
+		for entry in workers.values():
+			entry['utilization'] = entry['busy'] / wall
+
+		# The tail is how long the last worker kept going after the first one ran out of work
+		tail = wall - min(entry['finished'] for entry in workers.values())
+
+		with self._lock:
+			self._entry(pdk, None).setdefault('workers', dict())[stage] = {
+				'wall': wall, 'tail': tail, 'workers': workers
+			}
+
+		utilization = ', '.join(
+			f'{worker} {entry["utilization"] * 100:.0f}% ({entry["jobs"]} jobs)' for worker, entry in workers.items()
+		)
+		return f'{utilization}; tail {tail:.2f}s of {wall:.2f}s'
+
+	def add_parse_errors(self, pdk: str, library: str, errors: list[tuple[str, int, str, bool]]) -> None:
+		with self._lock:
+			self._entry(pdk, library)['parse_errors'].extend(
+				{ 'macro': name, 'line': line, 'error': message, 'recovered': recovered }
+				for name, line, message, recovered in errors
+			)
+
+	def parse_error_summary(self, pdk: str) -> str:
+		errors = [ err for lib in self._entry(pdk, None)['libraries'].values() for err in lib['parse_errors'] ]
+		if len(errors) == 0:
+			return ''
+		recovered = sum(err['recovered'] for err in errors)
+		return f'{len(errors)} MACROs failed to parse, {recovered} were recovered with the line scanner'
+
+	def cache_summary(self, pdk: str) -> str:
+		libraries = self._entry(pdk, None)['libraries'].values()
+		summary = list()
+		for cache in ('layout', 'fragment'):
+			hits   = sum(lib[f'{cache}_hits'] for lib in libraries)
+			total  = hits + sum(lib[f'{cache}_misses'] for lib in libraries)
+			if total > 0:
+				summary.append(f'{cache} {hits}/{total} hits ({hits / total * 100:.1f}%)')
+		return ', '.join(summary)
+
+	def report(self) -> dict:
+		peak_rss = None
+		if resource is not None:
+			# ru_maxrss is in KiB on Linux
+			peak_rss = {
+				'self':     resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+				'children': resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+			}
+
+		return {
+			'generated':     datetime.utcnow().isoformat(),
+			'argv':          sys.argv[1:],
+			'total_seconds': perf_counter() - self._start,
+			'peak_rss_kib':  peak_rss,
+			'pdks':          self.pdks,
+		}
+
+
+class _TimedWriter:
+	''' Wraps a file so the time spent actually writing can be split out from rendering '''
+
+	def __init__(self, file: TextIO) -> None:
+		self._file = file
+		self.elapsed = 0.0
+
+	def write(self, data: str) -> int:
+		start = perf_counter()
+		res = self._file.write(data)
+		self.elapsed += perf_counter() - start
+		return res
+
+	def writelines(self, lines: Iterable[str]) -> None:
+		for line in lines:
+			self.write(line)
+
+	def flush(self) -> None:
+		start = perf_counter()
+		self._file.flush()
+		self.elapsed += perf_counter() - start
+
+
+profiler = Profiler()
+
+
 class Property:
+	__slots__ = ( 'name', 'value', 'id', 'hide', 'pos', 'justify' )
+
 	def __init__(self, name: str, value: str, pid: int, hide: bool = True) -> None:
 		self.name = name
 		self.value = value
@@ -63,6 +308,31 @@ class Property:
 	def __repr__(self) -> str:
 		return f'(property "{self.name}" "{self.value}" (id {self.id}))'
 
+	def to_sexpr(self, compact: bool = False) -> str:
+		x, y, r = self.pos
+		if compact:
+			return (
+				f'(property "{self.name}" "{self.value}" (id {self.id}) (at {x} {y} {r}) (effects (font (size 1 1))'
+				f'{" (justify top)" if self.justify else ""}{" hide" if self.hide else ""}))'
+			)
+
+		justify = '      (justify top)\n' if self.justify else ''
+		hide    = '      hide\n' if self.hide else ''
+		return (
+			f'  (property\n      "{self.name}"\n      "{self.value}"\n      (id {self.id})\n'
+			f'      (at {x} {y} {r})\n      (effects\n      (font\n          (size 1 1)\n      )\n'
+			f'{justify}{hide}      )\n  )\n'
+		)
+
+
+@lru_cache(maxsize = None)
+def shared_property(name: str, value: str, pid: int, hide: bool = True) -> Property:
+	'''
+	A Property that is shared between every cell with the same name and value, such as
+	the PDK or library name, so these must never be modified once they're created.
+	'''
+	return Property(sys.intern(name), sys.intern(value), pid, hide)
+
 
 class PinDir(Enum):
 	INPUT         = auto()
@@ -138,21 +408,29 @@ class PinType(Enum):
 			return PinType.SIGNAL
 
 class Pin:
+	__slots__ = ( 'name', 'number', 'dir', 'type', 'x', 'y', 'rot' )
+
 	def __init__(self, name: str, d: str, typ: str, num: int = 0) -> None:
 		self.name = name
 		self.number = num
 		self.dir = PinDir.from_str(d)
 		self.type = PinType.from_str(typ)
-		self.pos = (0, 0, 0)
+		self.x = 0
+		self.y = 0
+		self.rot = 0
+
+	@property
+	def pos(self) -> tuple[float, float, float]:
+		return (self.x, self.y, self.rot)
 
 	def set_x(self, x: float):
-		self.pos = (x, self.pos[1], self.pos[2])
+		self.x = x
 
 	def set_y(self, y: float):
-		self.pos = (self.pos[0], y, self.pos[2])
+		self.y = y
 
 	def set_rot(self, r: float):
-		self.pos = (self.pos[0], self.pos[1], r)
+		self.rot = r
 
 	def electrical_type(self) -> str:
 		if self.type == PinType.POWER or self.type == PinType.GROUND:
@@ -191,6 +469,22 @@ class Pin:
 	def __repr__(self) -> str:
 		return f'(pin "{self.name}" {self.type} {self.dir})'
 
+	def to_sexpr(self, compact: bool = False) -> str:
+		x, y, r = self.pos
+		if compact:
+			return (
+				f'(pin {self.electrical_type()} {self.graphical_style()} (at {x} {y} {r}) (length 2.54) '
+				f'(name "{self.name}" (effects (font (size 1 1)) hide)) '
+				f'(number "{self.number}" (effects (font (size 1 1)) hide)))'
+			)
+
+		return (
+			f'  (pin\n      {self.electrical_type()}\n      {self.graphical_style()}\n      (at {x} {y} {r})\n'
+			f'      (length 2.54)\n      (name "{self.name}"\n      (effects\n          (font\n          (size 1 1)\n'
+			f'          )\n          hide\n      )\n      )\n      (number "{self.number}"\n      (effects\n'
+			f'          (font\n          (size 1 1)\n          )\n          hide\n      )\n      )\n  )\n'
+		)
+
 class CellType(Enum):
 	PFET      = auto()
 	NFET      = auto()
@@ -219,7 +513,103 @@ class CellType(Enum):
 				return CellType.CELL
 
 
+class Macro:
+	__slots__ = ( 'name', 'pins', 'size', 'origin', 'cell_class', 'foreign', 'symmetry' )
+
+	def __init__(self, name: str, pins: list[tuple[str, str | None, str | None]]) -> None:
+		self.name = name
+		self.pins = pins
+		self.size = (0.0, 0.0)
+		self.origin = (0.0, 0.0)
+		self.cell_class = ''
+		self.foreign = ''
+		self.symmetry = ''
+
+	def __str__(self) -> str:
+		return self.__repr__()
+
+	def __repr__(self) -> str:
+		return (
+			f'(macro "{self.name}" (size {self.size}) (origin {self.origin}) (class "{self.cell_class}") '
+			f'(foreign "{self.foreign}") (symmetry "{self.symmetry}") (pins {self.pins}))'
+		)
+
+
+class Subckt:
+	''' A `.subckt` in a SPICE netlist, only the location is kept and the body is read on demand '''
+	__slots__ = ( 'name', 'netlist', 'offset', 'length' )
+
+	def __init__(self, name: str, netlist: Path, offset: int, length: int) -> None:
+		self.name = name
+		self.netlist = netlist
+		self.offset = offset
+		self.length = length
+
+	@property
+	def body(self) -> str:
+		with self.netlist.open('rb') as f:
+			f.seek(self.offset)
+			return f.read(self.length).decode('utf-8')
+
+	def __str__(self) -> str:
+		return self.__repr__()
+
+	def __repr__(self) -> str:
+		return f'(subckt "{self.name}" (netlist "{self.netlist}") (offset {self.offset}) (length {self.length}))'
+
+
+class CellLibrary:
+	'''
+	The files in a cell library as found by `scan_pdk`, each kind of file maps to a list
+	of (path, size, mtime), or is `None` if the library doesn't have a directory for it.
+	'''
+	__slots__ = ( 'name', 'path', 'files' )
+
+	def __init__(self, name: str, path: Path, kinds: tuple[str, ...] = INVENTORY_KINDS) -> None:
+		self.name = name
+		self.path = path
+		self.files: dict[str, list[tuple[Path, int, int]] | None] = { kind: None for kind in kinds }
+
+	def __str__(self) -> str:
+		return self.__repr__()
+
+	def __repr__(self) -> str:
+		counts = ' '.join(
+			f'({kind} {len(files) if files is not None else "none"})' for kind, files in self.files.items()
+		)
+		return f'(library "{self.name}" (path "{self.path}") {counts})'
+
+
+class Layout:
+	'''
+	The symbol geometry for a given set of pins, every cell with the same ordered pins ends up
+	with the same bounds and pin positions, so this is computed once and shared between them.
+	'''
+	__slots__ = ( 'pin_counts', 'padding', 'bounds', 'positions', 'fragments' )
+
+	def __init__(
+		self, pin_counts: tuple[int, int, int, int, int], padding: tuple[float, float],
+		bounds: tuple[float, float, float, float], positions: list[tuple[float, float, float]]
+	) -> None:
+		self.pin_counts = pin_counts
+		self.padding = padding
+		self.bounds = bounds
+		self.positions = positions
+		# The rendered rectangle and pins for the sexpr backend, keyed by if it's compact or not
+		self.fragments: dict[bool, str] = dict()
+
+
+# Layouts keyed by the ordered (name, dir, type, number) of each pin, see `Cell.__init__`
+_layout_cache: dict[tuple, Layout] = dict()
+# The number of times the rectangle and pins had to actually be rendered, rather than coming from `Layout.fragments`
+_fragment_renders = 0
+
+
 class Cell:
+	__slots__ = (
+		'id', 'pins', 'cell_type', 'properties', 'base', '_pin_counts', '_padding', '_bounds', '_layout', '_cell_template'
+	)
+
 	def _count_pins(self) -> None:
 		pwr = 0
 		gnd = 0
@@ -374,28 +764,46 @@ class Cell:
 		self.id = name
 		self.pins = pins
 		self.cell_type = cell_type
-		self._pin_counts = None
-		self._count_pins()
-		self._padding = (0, 0, 0, 0)
-		self._bounds = self._calc_bounds()
-		self._fixup_pins()
+		# The cell this one is emitted as being derived from with `extends`, see `emit_symlibs`
+		self.base: Cell | None = None
+
+		signature = tuple((pin.name, pin.dir, pin.type, pin.number) for pin in pins)
+		self._layout = _layout_cache.get(signature, None)
+
+		if self._layout is None:
+			self._pin_counts = None
+			self._count_pins()
+			self._padding = (0, 0, 0, 0)
+			self._bounds = self._calc_bounds()
+			self._fixup_pins()
+			self._layout = Layout(self._pin_counts, self._padding, self._bounds, [ pin.pos for pin in pins ])
+			_layout_cache[signature] = self._layout
+		else:
+			self._pin_counts = self._layout.pin_counts
+			self._padding = self._layout.padding
+			self._bounds = self._layout.bounds
+			for pin, (x, y, rot) in zip(pins, self._layout.positions):
+				pin.x = x
+				pin.y = y
+				pin.rot = rot
 
 		self.properties = []
 
 		match self.cell_type:
 			case CellType.PFET | CellType.NFET:
-				self.properties.append(Property('Reference', 'Q', 0))
+				self.properties.append(shared_property('Reference', 'Q', 0))
 			case _:
-				self.properties.append(Property('Reference', 'X', 0))
+				self.properties.append(shared_property('Reference', 'X', 0))
 
 		self.properties += [
-			Property('Value',     name,          1, False),
-			Property('Footprint', f'{bounds}',   2),
-			Property('Datasheet', lef_file_name, 3),
+			Property('Value',            name,          1, False),
+			shared_property('Footprint', f'{bounds}',   2),
+			shared_property('Datasheet', lef_file_name, 3),
 			*properties
 		]
 
-
+		# This logs a warning for any odd FETs, so it's only worked out the once
+		self._cell_template = self._pick_template()
 
 		self._fixup_properties()
 
@@ -403,7 +811,13 @@ class Cell:
 		self.properties.append(prop)
 		self._fixup_properties()
 
-	def render_cell(self) -> str:
+	def _template(self) -> Path:
+		if self.base is not None:
+			return CELL_TEMPLATE_DERIVED
+		return self._cell_template
+
+	def _pick_template(self) -> Path:
+		''' Work out which template this cell is rendered with when it's not derived, only done once per cell '''
 		template = None
 		match self.cell_type:
 			case CellType.CELL:
@@ -431,14 +845,81 @@ class Cell:
 			case _:
 				raise RuntimeError('Unknown Cell type')
 
+		return template
 
-		with template.open('r') as tmpl:
-			cell_tmpl = env.from_string(''.join(tmpl.readlines()))
-
-		return cell_tmpl.render(
+	def render_cell(self) -> str:
+		return get_template(self._template()).render(
 			sym = self
 		)
 
+	def can_derive_from(self, base: 'Cell') -> bool:
+		'''
+		If this cell has the same graphics and pins as `base`, and so could just extend it. It also needs
+		every property `base` has, anything it doesn't override would otherwise be inherited from `base`.
+		'''
+		return (
+			self._layout is base._layout and self._template() == CELL_TEMPLATE_CELL and
+			base._template() == CELL_TEMPLATE_CELL and
+			{ prop.name for prop in base.properties } <= { prop.name for prop in self.properties }
+		)
+
+	def derived_properties(self) -> list[Property]:
+		''' The properties of this cell that differ from its base, along with the mandatory ones '''
+		inherited = { (prop.name, prop.value) for prop in self.base.properties }
+		return [
+			prop for prop in self.properties
+			if prop.id <= 3 or (prop.name, prop.value) not in inherited
+		]
+
+	def to_sexpr(self, compact: bool = False) -> str:
+		template = self._template()
+
+		if self.base is not None:
+			props = [ prop.to_sexpr(compact) for prop in self.derived_properties() ]
+			if compact:
+				return ' '.join((f'(symbol "{self.id}" (extends "{self.base.id}")', *props)) + ')'
+			return f'(symbol\n  "{self.id}"\n  (extends "{self.base.id}")\n{"".join(props)})'
+
+		# The FET symbols are mostly fixed graphics, so just lean on the templates for those
+		if template != CELL_TEMPLATE_CELL:
+			sexpr = self.render_cell()
+			return _compact_sexpr(sexpr) if compact else sexpr
+
+		# Only the properties differ between cells with the same layout, so the rest is rendered once
+		body = self._layout.fragments.get(compact, None)
+		if body is None:
+			global _fragment_renders
+			_fragment_renders += 1
+			body = self._render_body(compact)
+			self._layout.fragments[compact] = body
+
+		if compact:
+			return ' '.join((
+				f'(symbol "{self.id}" (in_bom no) (on_board yes)',
+				*(prop.to_sexpr(True) for prop in self.properties),
+				body,
+			)) + ')'
+
+		props = ''.join(prop.to_sexpr() for prop in self.properties)
+		return f'(symbol\n  "{self.id}"\n  (in_bom no)\n  (on_board yes)\n{props}{body})'
+
+	def _render_body(self, compact: bool) -> str:
+		x0, y0, x1, y1 = self._bounds
+
+		if compact:
+			return ' '.join((
+				f'(rectangle (start {x0} {y0}) (end {x1} {y1}) '
+				'(stroke (width 0.1) (type solid) (color 0 0 0 0)) (fill (type background)))',
+				*(pin.to_sexpr(True) for pin in self.pins),
+			))
+
+		pins = ''.join(pin.to_sexpr() for pin in self.pins)
+		return (
+			f'  (rectangle\n      (start {x0} {y0})\n      (end {x1} {y1})\n      (stroke\n      (width 0.1)\n'
+			f'      (type solid)\n      (color 0 0 0 0)\n      )\n      (fill\n      (type background)\n      )\n  )\n'
+			f'{pins}'
+		)
+
 	def fet_gates(self) -> dict[str, int]:
 		if self.cell_type not in (CellType.NFET, CellType.PFET):
 			raise RuntimeError(f'Cell is a {self.cell_type}, not a FET')
@@ -485,14 +966,509 @@ class Cell:
 		return f'({self.cell_type} "{self.id}" {" ".join(map(str, self.pins))})'
 
 
-def _flatten(col):
-	return [i for sl in list(col) for i in sl]
+def _compact_sexpr(sexpr: str) -> str:
+	''' Collapse a pretty-printed S-expression down onto a single line '''
+	out = list()
+	prev = '('
+
+	for tok in SEXPR_TOKEN_REGEX.findall(sexpr):
+		if tok != ')' and prev != '(':
+			out.append(' ')
+		out.append(tok)
+		prev = tok
+
+	return ''.join(out)
+
+
+def _hash_file(file: Path) -> str:
+	digest = hashlib.sha256()
+	with file.open('rb') as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+_lef_model = None
+
+def load_lef_model(args: Namespace):
+	global _lef_model
+	if _lef_model is None:
+		_lef_model = _load_lef_model(args)
+	return _lef_model
+
+def _load_lef_model(args: Namespace):
+	CACHE: Path | None = args.cache_dir
+	# `--cross-check` with the fast parser still needs the full grammar to check against
+	GRAMMAR = TATSU_LEF_TOKENS if args.parser == 'tokens' else TATSU_LEF_GRAMMAR
+
+	if CACHE is None:
+		log.info('Compiling TatSu parser, this might take a minute')
+		with GRAMMAR.open('r') as lef_grammar:
+			return tatsu.compile(''.join(lef_grammar.readlines()))
+
+	# The cache key covers both the grammar and TatSu itself, so bumping either
+	# one will cause the parser to be re-compiled rather than loading a stale model
+	cache_key = hashlib.sha256(
+		f'{_hash_file(GRAMMAR)}:{tatsu.__version__}'.encode('utf-8')
+	).hexdigest()[:16]
+	MODEL_CACHE = (CACHE / f'{GRAMMAR.stem}-{cache_key}.pickle')
+
+	if MODEL_CACHE.exists():
+		log.info(f'Loading cached TatSu parser from \'{MODEL_CACHE}\'')
+		try:
+			with MODEL_CACHE.open('rb') as f:
+				return pickle.load(f)
+		except Exception as e:
+			log.warning(f'Unable to load cached TatSu parser ({e}), recompiling')
+
+	log.info('Compiling TatSu parser, this might take a minute')
+	with GRAMMAR.open('r') as lef_grammar:
+		model = tatsu.compile(''.join(lef_grammar.readlines()))
+
+	log.debug(f' => Caching TatSu parser to \'{MODEL_CACHE}\'')
+	try:
+		CACHE.mkdir(exist_ok = True, parents = True)
+		# Stale models are useless once the key changes, so clear them out
+		for stale in CACHE.glob(f'{GRAMMAR.stem}-*.pickle'):
+			stale.unlink(missing_ok = True)
+
+		tmp = MODEL_CACHE.with_suffix(f'.{getpid()}.tmp')
+		with tmp.open('wb') as f:
+			pickle.dump(model, f)
+		tmp.replace(MODEL_CACHE)
+	except OSError as e:
+		log.warning(f'Unable to cache TatSu parser: {e}')
+
+	return model
+
+
+@contextmanager
+def map_input(file: Path) -> Iterator[bytes | mmap]:
+	'''
+	Map an input file into memory read-only, so it can be scanned without reading it in
+	or holding a copy of it, only the bits that are actually kept need to be decoded.
+	'''
+
+	with file.open('rb') as f:
+		# Empty files can't be mapped
+		if f.seek(0, 2) == 0:
+			yield b''
+			return
+
+		with mmap(f.fileno(), 0, access = ACCESS_READ) as data:
+			yield data
+
+def decode_input(data: bytes | mmap, start: int = 0, end: int | None = None) -> str:
+	''' Decode a slice of a mapped input without copying it first, with the newlines normalized like `open` would '''
+	with memoryview(data) as view, view[start:end] as part:
+		text = str(part, 'utf-8')
+
+	if '\r' in text:
+		text = text.replace('\r\n', '\n').replace('\r', '\n')
+	return text
+
+def split_macros(lef: bytes | mmap) -> list[tuple[str, int, int]]:
+	'''
+	Find the byte offsets of the individual MACRO blocks in the raw LEF, this lets us hand
+	chunks of a library to different workers without needing to parse or even decode it first.
+	'''
+
+	macros = list()
+
+	for start in MACRO_START_REGEX.finditer(lef):
+		name = start.group(1)
+		end = re.compile(rb'^[ \t]*END[ \t]+' + re.escape(name) + rb'[ \t]*\r?$', re.MULTILINE).search(lef, start.end())
+		name = name.decode('utf-8')
+		if end is None:
+			log.warning(f'MACRO \'{name}\' has no matching END statement, skipping')
+			continue
+		macros.append((name, start.start(), end.end()))
+
+	return macros
+
+def macro_sources(lef: bytes | mmap, macros: list[tuple[str, int, int]]) -> Iterator[tuple[str, int, str]]:
+	'''
+	Decode just the given MACROs out of the raw LEF, as the (name, line, text) of each one, so they
+	can be parsed on their own and any errors can still be pointed back at the right line of the LEF.
+
+	Each MACRO is only decoded as it's asked for, so `lef` has to stay mapped until they've all been consumed.
+	'''
+
+	line = 1
+	pos = 0
+
+	for name, start, end in macros:
+		line += lef[pos:start].count(b'\n')
+		pos = start
+		yield (name, line, decode_input(lef, start, end))
+
+
+def _join_tokens(ast) -> str:
+	if ast is None:
+		return ''
+	if isinstance(ast, str):
+		return ast
+	return ''.join(_join_tokens(tok) for tok in ast)
+
+
+class LefSemantics:
+	'''
+	TatSu semantic actions for the LEF grammar.
+
+	These build the `Macro`s while the parser is running, rather than having it
+	hand back a full AST that we then walk. Identifiers and numbers are joined up
+	as soon as they're matched, and everything we never look at (OBS, PORT,
+	DENSITY, antenna, and property statements) is thrown away as soon as it's
+	parsed, so it's never held on to for the rest of the file.
+	'''
+
+	def IDENT(self, ast) -> str:
+		return _join_tokens(ast)
+
+	def FLOAT(self, ast) -> str:
+		return _join_tokens(ast)
+
+	def INTEGER(self, ast) -> str:
+		return _join_tokens(ast)
+
+	def _prune(self, ast) -> None:
+		return None
+
+	macro_s_obs     = _prune
+	macro_s_density = _prune
+	pin_port        = _prune
+	pin_antenna     = _prune
+	property        = _prune
+	layer_geometry  = _prune
+	layer           = _prune
+	polygon         = _prune
+	path            = _prune
+	rectangle       = _prune
+
+	pin_antenna_pmetal       = _prune
+	pin_antenna_pmetalside   = _prune
+	pin_antenna_pcut         = _prune
+	pin_antenna_diffarea     = _prune
+	pin_antenna_model        = _prune
+	pin_antenna_gatearea     = _prune
+	pin_antenna_maxareac     = _prune
+	pin_antenna_maxsideareac = _prune
+	pin_antenna_maxcutc      = _prune
+
+	def pin_direction(self, ast) -> str:
+		# `OUTPUT TRISTATE` comes back as a list of tokens
+		pin_dir = ast['pin_dir']
+		return pin_dir if isinstance(pin_dir, str) else ' '.join(pin_dir)
+
+	def pin_use(self, ast) -> str:
+		return ast['pin_type']
+
+	def macro_s_pin(self, ast) -> tuple[str, str | None, str | None]:
+		pin_dir = None
+		pin_type = None
+		for stmt in ast['pstmnts']:
+			if 'dir' in stmt:
+				pin_dir = stmt['dir']
+			if 'use' in stmt:
+				pin_type = stmt['use']
+		return (ast['name'], pin_dir, pin_type)
+
+	def macro(self, ast) -> Macro:
+		mstmts = ast['mstmts']
+		res = Macro(
+			IDENT_HEAD_REGEX.match(ast['name']).group(0),
+			[ stmt['pin'] for stmt in mstmts if 'pin' in stmt ]
+		)
+
+		for stmt in mstmts:
+			if 'size'     in stmt:
+				res.size = (float(stmt['size']['w']), float(stmt['size']['h']))
+			if 'origin'   in stmt:
+				res.origin = (float(stmt['origin']['pt']['x']), float(stmt['origin']['pt']['y']))
+			if 'class'    in stmt:
+				res.cell_class = f'{stmt["class"]["type"]}'
+			if 'foreign'  in stmt:
+				res.foreign = stmt['foreign']['name']
+			if 'symmetry' in stmt:
+				res.symmetry = ''.join(stmt['symmetry']['axes'])
+
+		return res
+
+
+def scan_lef_macros(lef: Iterable[str]) -> Iterator[Macro]:
+	'''
+	A fast, line oriented alternative to the TatSu parser.
+
+	This only pulls out the bits of each MACRO that we actually use, and skips over
+	OBS, PORT, and DENSITY bodies without looking at their contents.
+	'''
+
+	macro: Macro | None = None
+	macro_name = ''
+	pin: list | None = None
+	skipping = False
+
+	for line in lef:
+		if skipping:
+			skipping = LEF_BLOCK_END_REGEX.match(line) is None
+			continue
+
+		for stmt in line.partition('#')[0].split(';'):
+			toks = stmt.split()
+			if len(toks) == 0:
+				continue
+
+			kw = toks[0]
+			if macro is None:
+				# `MACRO` statements inside of `PROPERTYDEFINITIONS` have a type after the name
+				if kw == 'MACRO' and len(toks) == 2:
+					macro = Macro(IDENT_HEAD_REGEX.match(toks[1]).group(0), list())
+					macro_name = toks[1]
+				continue
+
+			if kw in ('OBS', 'PORT', 'DENSITY'):
+				skipping = True
+				break
+			elif kw == 'END' and len(toks) > 1:
+				if pin is not None and toks[1] == pin[0]:
+					macro.pins.append(tuple(pin))
+					pin = None
+				elif pin is None and toks[1] == macro_name:
+					yield macro
+					macro = None
+			elif pin is not None:
+				if kw == 'DIRECTION':
+					pin[1] = ' '.join(toks[1:])
+				elif kw == 'USE':
+					pin[2] = toks[1]
+			elif kw == 'PIN':
+				pin = [ toks[1], None, None ]
+			elif kw == 'SIZE':
+				macro.size = (float(toks[1]), float(toks[3]))
+			elif kw == 'ORIGIN':
+				macro.origin = (float(toks[1]), float(toks[2]))
+			elif kw == 'CLASS':
+				macro.cell_class = toks[1] if len(toks) == 2 else f'{tuple(toks[1:])}'
+			elif kw == 'FOREIGN':
+				macro.foreign = toks[1]
+			elif kw == 'SYMMETRY':
+				macro.symmetry = ''.join(toks[1:])
+
+
+def _cross_check(
+	tatsu_macros: list[Macro], fast_macros: list[Macro], cellib: Path, failed: set[str] = frozenset()
+) -> None:
+	''' Compare what both parsers extracted, where `failed` are the names of the MACROs TatSu couldn't parse '''
+	reference = { m.name: m for m in tatsu_macros }
+	candidate = { m.name: m for m in fast_macros }
+	mismatched = 0
+
+	for name in sorted(reference.keys() | candidate.keys() | failed):
+		if name in failed:
+			mismatched += 1
+			log.warning(f' ==> Parser mismatch in {cellib.name} for MACRO \'{name}\', TatSu was unable to parse it')
+			continue
+
+		ref = reference.get(name, None)
+		cand = candidate.get(name, None)
+		if repr(ref) != repr(cand):
+			mismatched += 1
+			log.warning(f' ==> Parser mismatch in {cellib.name} for MACRO \'{name}\'')
+			log.warning(f' ===>  tatsu: {ref}')
+			log.warning(f' ===>   fast: {cand}')
+
+	if mismatched == 0:
+		log.info(f' ==> Parser cross-check passed for {cellib.name} ({len(reference)} macros)')
+	else:
+		log.error(f' ==> Parser cross-check found {mismatched} mismatched macros in {cellib.name}')
+
+
+def _source_lines(sources: Iterable[tuple[str, int, str]]) -> Iterator[str]:
+	for _, _, text in sources:
+		yield from text.splitlines()
+
+def parse_macros(
+	model, sources: Iterable[tuple[str, int, str]], cellib: Path, args: Namespace,
+	errors: list[tuple[str, int, str, bool]] | None = None
+) -> list[Macro]:
+	'''
+	Parse each of the (name, line, text) MACROs from `macro_sources` on its own, so one MACRO that
+	doesn't match the grammar doesn't take the rest of the library down with it.
+
+	Any MACRO that fails is retried with the line scanner, which skips over anything it doesn't
+	understand, and the (name, line, error, recovered) of each failure is added to `errors`.
+	'''
+
+	PARSER: str = args.parser
+	CROSS_CHECK: bool = args.cross_check
+
+	log.debug(f' ==> Parsing {cellib.name}')
+
+	if PARSER == 'fast' and not CROSS_CHECK:
+		return list(scan_lef_macros(_source_lines(sources)))
+
+	macros = list()
+	# Only what TatSu actually parsed, so anything that was recovered isn't cross-checked against itself
+	parsed = list()
+	failed = set()
+	fast_macros = list()
+
+	# The sources are only walked the once, each MACRO going through both parsers when cross-checking
+	for name, line, text in sources:
+		fast = list(scan_lef_macros(text.splitlines())) if CROSS_CHECK else None
+		if fast is not None:
+			fast_macros.extend(fast)
+
+		try:
+			ast = model.parse(f'{text}\nEND LIBRARY\n', semantics = LefSemantics())
+		except FailedParse as e:
+			err_line = line + e.tokenizer.line_info(e.pos).line
+			log.warning(f' ==> Unable to parse MACRO \'{name}\' at {cellib.name}:{err_line}: {e.message}')
+
+			recovered = fast if fast is not None else list(scan_lef_macros(text.splitlines()))
+			if len(recovered) > 0:
+				log.warning(f' ===> Recovered \'{name}\' with the line scanner')
+			if errors is not None:
+				errors.append((name, err_line, e.message, len(recovered) > 0))
+			failed.add(name)
+			macros.extend(recovered)
+			continue
+
+		found = [ elem['macro'] for elem in ast[0] if 'macro' in elem ]
+		parsed.extend(found)
+		macros.extend(found)
+
+	if CROSS_CHECK:
+		_cross_check(parsed, fast_macros, cellib, failed)
+		if PARSER == 'fast':
+			return fast_macros
+
+	return macros
+
+
+def parse_lef(
+	model, cellib: Path, args: Namespace, errors: list[tuple[str, int, str, bool]] | None = None
+) -> list[Macro]:
+	'''
+	Parse a whole LEF file. The fast parser is fed it a line at a time straight from the file,
+	otherwise it's mapped and each MACRO is decoded once, directly into the text that's handed to TatSu.
+	'''
+
+	if args.parser == 'fast' and not args.cross_check and not filters_cells(args):
+		log.debug(f' ==> Parsing {cellib.name}')
+		with cellib.open('r') as lib:
+			return list(scan_lef_macros(lib))
 
-def _flatten_str(col):
-	return ''.join(_flatten(col))
+	with map_input(cellib) as lef:
+		return parse_macros(model, read_lef(lef, cellib, args), cellib, args, errors)
 
 
-def extract(model, cellib: Path, args: Namespace) -> list[Cell]:
+def _macro_db_generator(db: sqlite3.Connection) -> str | None:
+	try:
+		row = db.execute('SELECT generator FROM meta').fetchone()
+	except sqlite3.Error:
+		return None
+	return row[0] if row is not None else None
+
+def open_macro_db(args: Namespace) -> sqlite3.Connection | None:
+	CACHE: Path | None = args.cache_dir
+	if CACHE is None:
+		return None
+
+	MACRO_DB = (CACHE / MACRO_DB_NAME)
+	try:
+		CACHE.mkdir(exist_ok = True, parents = True)
+		db = sqlite3.connect(MACRO_DB)
+		# Any change to the grammars, semantics, or scanner could change what's extracted from a MACRO
+		generator = _get_generator_digest()
+		if (
+			db.execute('PRAGMA user_version').fetchone()[0] != MACRO_DB_VERSION or
+			_macro_db_generator(db) != generator
+		):
+			log.debug(f' => Creating MACRO database \'{MACRO_DB}\'')
+			db.executescript(f'''
+				DROP TABLE IF EXISTS meta;
+				DROP TABLE IF EXISTS libraries;
+				DROP TABLE IF EXISTS macros;
+				CREATE TABLE meta (
+					generator TEXT NOT NULL
+				);
+				CREATE TABLE libraries (
+					sha256 TEXT NOT NULL, parser TEXT NOT NULL, name TEXT NOT NULL,
+					PRIMARY KEY (sha256, parser)
+				);
+				CREATE TABLE macros (
+					sha256 TEXT NOT NULL, parser TEXT NOT NULL, idx INTEGER NOT NULL,
+					name TEXT NOT NULL, pins TEXT NOT NULL,
+					size_x REAL NOT NULL, size_y REAL NOT NULL, origin_x REAL NOT NULL, origin_y REAL NOT NULL,
+					class TEXT NOT NULL, foreign_name TEXT NOT NULL, symmetry TEXT NOT NULL,
+					PRIMARY KEY (sha256, parser, idx)
+				) WITHOUT ROWID;
+				PRAGMA user_version = {MACRO_DB_VERSION};
+			''')
+			with db:
+				db.execute('INSERT INTO meta VALUES (?)', (generator,))
+		return db
+	except sqlite3.Error as e:
+		log.warning(f'Unable to open MACRO database \'{MACRO_DB}\': {e}')
+		return None
+
+def has_macros(db: sqlite3.Connection, sha256: str, parser: str) -> bool:
+	try:
+		return db.execute(
+			'SELECT 1 FROM libraries WHERE sha256 = ? AND parser = ?', (sha256, parser)
+		).fetchone() is not None
+	except sqlite3.Error as e:
+		log.warning(f'Unable to read from MACRO database: {e}')
+		return False
+
+def load_macros(db: sqlite3.Connection, sha256: str, parser: str) -> list[Macro] | None:
+	try:
+		if db.execute(
+			'SELECT 1 FROM libraries WHERE sha256 = ? AND parser = ?', (sha256, parser)
+		).fetchone() is None:
+			return None
+
+		rows = db.execute(
+			'SELECT name, pins, size_x, size_y, origin_x, origin_y, class, foreign_name, symmetry '
+			'FROM macros WHERE sha256 = ? AND parser = ? ORDER BY idx', (sha256, parser)
+		)
+	except sqlite3.Error as e:
+		log.warning(f'Unable to read from MACRO database: {e}')
+		return None
+
+	macros = list()
+	for name, pins, size_x, size_y, origin_x, origin_y, cell_class, foreign, symmetry in rows:
+		macro = Macro(name, [ tuple(pin) for pin in json.loads(pins) ])
+		macro.size = (size_x, size_y)
+		macro.origin = (origin_x, origin_y)
+		macro.cell_class = cell_class
+		macro.foreign = foreign
+		macro.symmetry = symmetry
+		macros.append(macro)
+
+	return macros
+
+def store_macros(db: sqlite3.Connection, sha256: str, parser: str, cellib: Path, macros: list[Macro]) -> None:
+	try:
+		with db:
+			db.execute('DELETE FROM macros WHERE sha256 = ? AND parser = ?', (sha256, parser))
+			db.executemany(
+				'INSERT INTO macros VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+					(
+						sha256, parser, idx, macro.name, json.dumps(macro.pins),
+						*macro.size, *macro.origin, macro.cell_class, macro.foreign, macro.symmetry
+					) for idx, macro in enumerate(macros)
+				)
+			)
+			db.execute('INSERT OR REPLACE INTO libraries VALUES (?, ?, ?)', (sha256, parser, cellib.stem))
+	except sqlite3.Error as e:
+		log.warning(f'Unable to store \'{cellib.stem}\' in the MACRO database: {e}')
+
+
+def build_cells(
+	macros: list[Macro], cellib: Path, args: Namespace
+) -> tuple[list[Cell], tuple[float, float]]:
 	IGNORE_PWR: bool = args.ignore_pwr
 	INFER_PWR: bool = not args.dont_infer_pwr
 	SPLIT_STR: str = args.split_char
@@ -500,117 +1476,94 @@ def extract(model, cellib: Path, args: Namespace) -> list[Cell]:
 	STRIP_NAME: bool = not args.dont_strip
 	KEEP_EMPTY: bool = args.keep_empty
 
-	ast = None
 	cells = list()
-
-	log.debug(f' ==> Parsing {cellib.name}')
-	with cellib.open('r') as lib:
-		ast = model.parse(''.join(lib.readlines()))
-
-	if ast is None:
-		log.error(f'Error parsing cell library {cellib.name}')
-		return None
+	bounds = (0.0, 0.0)
+	layout_time = 0.0
+	layouts = len(_layout_cache)
+	_extract_start = perf_counter()
 
 	log.debug(' ==> Extracting cells')
-	for elem in ast[0]:
-		macro = None if 'macro' not in elem else elem['macro']
-		if macro is not None:
-			raw_name = ''.join(macro['name'][0])
-			cell_name = raw_name.split(SPLIT_STR)[-1] if SPLIT_STR is not None else raw_name
-			if STRIP_NAME:
-				cell_name = cell_name.removeprefix(f'{cellib.stem}__')
-			log.debug(f' ===> Found cell \'{cell_name}\'')
-
-			cell_pins = list()
-			ignored_pins = 0
-
-			log.debug(' ===> Looking for pins')
-			for stmt in macro['mstmts']:
-				pin = None if 'pin' not in stmt else stmt['pin']
-				if pin is not None:
-					pin_name = _flatten_str(pin['name'])
-					pin_dir = None
-					pin_type = None
-					for stmt in pin['pstmnts']:
-						if 'dir' in stmt:
-							pin_dir = stmt['dir']['pin_dir']
-						if 'use' in stmt:
-							pin_type = stmt['use']['pin_type']
-
-					if pin_type is None and INFER_PWR:
-						if 'vss' in pin_name.lower() or 'gnd' in pin_name.lower():
-							pin_type = 'GROUND'
-						elif 'vdd' in pin_name.lower() or 'vcc' in pin_name.lower():
-							pin_type = 'POWER'
-
-					if IGNORE_PWR and pin_type in ('GROUND', 'POWER'):
-						ignored_pins += 1
-						continue
-
-					cell_pins.append(Pin(
-						pin_name, pin_dir, pin_type, num = len(cell_pins) + 1
-					))
-
-			cell_pin_count = len(cell_pins)
-			log.debug(f' ===> Found {cell_pin_count} pins in cell \'{cell_name}\' ({ignored_pins} ignored)')
-
-			bounds     = (0.0, 0.0)
-			origin     = (0.0, 0.0)
-			cell_class = ''
-			foreign    = ''
-			symmetry   = ''
-
-			for stmt in macro['mstmts']:
-				if 'size'     in stmt:
-					bounds = (
-						float(_flatten_str(stmt['size'][2])),
-						float(_flatten_str(stmt['size'][5])),
-					)
-				if 'origin'   in stmt:
-					origin = (
-						float(_flatten_str(stmt['origin'][2]['x'])),
-						float(_flatten_str(stmt['origin'][2]['y'])),
-					)
-				if 'class'    in stmt:
-					cell_class = stmt['class']['type']
-				if 'foreign'  in stmt:
-					foreign = _flatten_str(stmt['foreign']['name'])
-				if 'symmetry' in stmt:
-					symmetry = _flatten_str(stmt['symmetry'][1])
-
-
-			cell_type = CellType.CELL
-
-			# TODO: Generalize/Better heuristics
-			# These are specific to sky130_fd_pr
-			if cell_name.startswith('rf_nfet'):
-				cell_type = CellType.NFET
-			elif cell_name.startswith('rf_pfet'):
-				cell_type = CellType.PFET
-
-			if cell_pin_count > 0 or KEEP_EMPTY:
-				if cell_pin_count == 0:
-					log.warning(f'The cell \'{cell_name}\' has 0 pins, but was kept anyway')
-				cells.append(Cell(
-					cell_name, cell_pins, cellib.name, cell_type,
-					bounds = bounds, properties = (
-						Property('Cell Class',    f'{cell_class}',  10),
-						Property('Foreign Cell',  f'{foreign}',     11),
-						Property('Cell Origin',   f'{origin}',      12),
-						Property('Cell Size',     f'{bounds}',      13),
-						Property('Cell Symmetry', f'{symmetry}',    14),
-						Property('Cell PDK',      f'{PDK}',         15),
-						Property('Cell Library',  f'{cellib.stem}', 16)
-					)
-				))
+	for macro in macros:
+		raw_name = macro.name
+		cell_name = raw_name.split(SPLIT_STR)[-1] if SPLIT_STR is not None else raw_name
+		if STRIP_NAME:
+			cell_name = cell_name.removeprefix(f'{cellib.stem}__')
+		log.debug(f' ===> Found cell \'{cell_name}\'')
+
+		cell_pins = list()
+		ignored_pins = 0
+
+		log.debug(' ===> Looking for pins')
+		for pin_name, pin_dir, pin_type in macro.pins:
+			if pin_type is None and INFER_PWR:
+				if 'vss' in pin_name.lower() or 'gnd' in pin_name.lower():
+					pin_type = 'GROUND'
+				elif 'vdd' in pin_name.lower() or 'vcc' in pin_name.lower():
+					pin_type = 'POWER'
+
+			if IGNORE_PWR and pin_type in ('GROUND', 'POWER'):
+				ignored_pins += 1
+				continue
 
-	log.info(f' ==> Found {len(cells)} cells in {cellib.stem}')
+			cell_pins.append(Pin(
+				sys.intern(pin_name), pin_dir, pin_type, num = len(cell_pins) + 1
+			))
+
+		cell_pin_count = len(cell_pins)
+		log.debug(f' ===> Found {cell_pin_count} pins in cell \'{cell_name}\' ({ignored_pins} ignored)')
+
+		bounds     = macro.size
+		origin     = macro.origin
+		cell_class = macro.cell_class
+		foreign    = macro.foreign
+		symmetry   = macro.symmetry
+
+		cell_type = CellType.CELL
+
+		# TODO: Generalize/Better heuristics
+		# These are specific to sky130_fd_pr
+		if cell_name.startswith('rf_nfet'):
+			cell_type = CellType.NFET
+		elif cell_name.startswith('rf_pfet'):
+			cell_type = CellType.PFET
+
+		if cell_pin_count > 0 or KEEP_EMPTY:
+			if cell_pin_count == 0:
+				log.warning(f'The cell \'{cell_name}\' has 0 pins, but was kept anyway')
+			# Constructing the cell is where all of the pin and symbol layout happens
+			_layout_start = perf_counter()
+			cells.append(Cell(
+				cell_name, cell_pins, cellib.name, cell_type,
+				bounds = bounds, properties = (
+					shared_property('Cell Class',    f'{cell_class}',  10),
+					Property('Foreign Cell',         f'{foreign}',     11),
+					shared_property('Cell Origin',   f'{origin}',      12),
+					shared_property('Cell Size',     f'{bounds}',      13),
+					shared_property('Cell Symmetry', f'{symmetry}',    14),
+					shared_property('Cell PDK',      f'{PDK}',         15),
+					shared_property('Cell Library',  f'{cellib.stem}', 16)
+				)
+			))
+			layout_time += perf_counter() - _layout_start
+
+	profiler.add(PDK, 'layout', layout_time, cellib.stem)
+	profiler.add(PDK, 'extract', perf_counter() - _extract_start - layout_time, cellib.stem)
+	layout_misses = len(_layout_cache) - layouts
+	profiler.count(PDK, cellib.stem, layout_hits = len(cells) - layout_misses, layout_misses = layout_misses)
+
+	return (cells, bounds)
+
+
+def inject_primitives(cells: list[Cell], cellib: Path, args: Namespace, bounds: tuple[float, float]) -> None:
+	PDK: str = args.pdk
 
 	if cellib.stem == 'sky130_fd_pr':
 		log.info(' ==> Cell library is sky130 primitive library, injecting fundamental FETs')
 		for fet_type in ('nfet', 'pfet'):
 			for fet_voltage in ('01v8', '03v3', '05v0'):
 				FET_NAME = f'sky130_{fet_type}_{fet_voltage}'
+				if not cell_selected(args, FET_NAME):
+					continue
 				log.info(f' ===> Inserting \'{FET_NAME}\'')
 				cells.append(Cell(
 					FET_NAME, [
@@ -629,276 +1582,1181 @@ def extract(model, cellib: Path, args: Namespace) -> list[Cell]:
 					)
 				))
 
-	return cells
 
+def _file_digest(file: Path, known: dict | None = None) -> dict:
+	size, mtime = _file_stat(file)
+	# Hashing multi-hundred megabyte LEFs isn't free, so trust the old hash if the file looks untouched
+	if known is not None and known['size'] == size and known['mtime'] == mtime:
+		return known
+
+	return {
+		'size':   size,
+		'mtime':  mtime,
+		'sha256': _hash_file(file),
+	}
 
-def collect_spice(args: Namespace) -> list[Path]:
+_generator_digest: str | None = None
+
+def _get_generator_digest() -> str:
+	global _generator_digest
+	if _generator_digest is None:
+		digest = hashlib.sha256()
+		for file in (Path(__file__), *sorted(EXTRA_DIR.iterdir())):
+			digest.update(_hash_file(file).encode('utf-8'))
+		_generator_digest = digest.hexdigest()
+	return _generator_digest
+
+def _symlib_path(args: Namespace, cellib: Path) -> Path:
+	OUTDIR: Path = args.outdir
 	PDK: str = args.pdk
+
+	if args.flatten:
+		return (OUTDIR / f'{PDK}_{cellib.stem}.kicad_sym')
+	return (OUTDIR / PDK / f'{cellib.stem}.kicad_sym')
+
+# The netlists the models for each cell library were actually taken from, which can be in other cell libraries
+_resolved_netlists: dict[Path, set[Path]] = dict()
+
+def _library_inputs(args: Namespace, cellib: Path, netlists: Iterable[Path] = ()) -> dict[str, list[Path]]:
+	inputs = { 'lef': [ cellib ], 'spice': [] }
+
+	if args.spice:
+		CELL_SPICE = (cellib.parent.parent / 'spice')
+		library = _inventory.get(cellib.parent.parent, None)
+		if library is not None:
+			inputs['spice'] = sorted(spice for spice, _, _ in library.files['spice'] or [])
+		elif CELL_SPICE.exists():
+			inputs['spice'] = sorted(
+				spice for spice in CELL_SPICE.iterdir() if spice.suffix.lower() == '.spice'
+			)
+		inputs['spice'] = sorted(set(inputs['spice']).union(netlists))
+
+	return inputs
+
+def _manifest_path(args: Namespace, outdir: Path) -> Path | None:
+	CACHE: Path | None = args.cache_dir
+	if CACHE is None:
+		return None
+
+	key = hashlib.sha256(str(outdir.resolve()).encode('utf-8')).hexdigest()[:16]
+	return (CACHE / MANIFEST_DIR / f'{key}.json')
+
+def load_manifest(args: Namespace, outdir: Path) -> dict:
+	MANIFEST = _manifest_path(args, outdir)
+	if MANIFEST is None or not MANIFEST.exists():
+		return dict()
+
+	try:
+		with MANIFEST.open('r') as f:
+			return json.load(f)
+	except (OSError, ValueError) as e:
+		log.warning(f'Unable to load build manifest \'{MANIFEST}\': {e}')
+		return dict()
+
+def save_manifest(args: Namespace, outdir: Path, manifest: dict) -> None:
+	MANIFEST = _manifest_path(args, outdir)
+	if MANIFEST is None:
+		return
+
+	try:
+		MANIFEST.parent.mkdir(exist_ok = True, parents = True)
+		tmp = MANIFEST.with_suffix(f'.{getpid()}.tmp')
+		with tmp.open('w') as f:
+			json.dump(manifest, f, indent = '\t', sort_keys = True)
+			f.write('\n')
+		tmp.replace(MANIFEST)
+	except OSError as e:
+		log.warning(f'Unable to save build manifest \'{MANIFEST}\': {e}')
+
+def library_manifest(
+	args: Namespace, cellib: Path, known: dict | None = None, netlists: Iterable[Path] | None = None
+) -> dict:
+	'''
+	The record of what goes into a symbol library. `netlists` are the ones its models were taken from,
+	when they aren't known yet the ones from the `known` record are checked again instead.
+	'''
+
 	PDK_ROOT: Path = args.pdk_root
+	known = known if known is not None else dict()
+
+	if netlists is None:
+		# Any that have gone missing are left out, and so the library is treated as stale
+		netlists = [ PDK_ROOT / name for name in known.get('spice', dict()) if (PDK_ROOT / name).is_file() ]
+
+	entry = {
+		'generator': _get_generator_digest(),
+		'options':   { opt: getattr(args, opt) for opt in MANIFEST_OPTIONS },
+	}
+
+	for kind, files in _library_inputs(args, cellib, netlists).items():
+		old = known.get(kind, dict())
+		entry[kind] = dict()
+		for file in files:
+			name = str(file.relative_to(PDK_ROOT))
+			entry[kind][name] = _file_digest(file, old.get(name, None))
+
+	return entry
+
+def is_up_to_date(args: Namespace, cellib: Path, manifest: dict) -> bool:
+	KISYM_LIB = _symlib_path(args, cellib)
+	known = manifest.get(KISYM_LIB.name, None)
+
+	if known is None or not KISYM_LIB.exists():
+		return False
+
+	# Only the contents matter here, a checkout or `touch` of an otherwise identical library is still up to date
+	output = known.get('output', None)
+	if output is None or _file_digest(KISYM_LIB, output)['sha256'] != output['sha256']:
+		log.debug(f' ==> \'{KISYM_LIB.name}\' was modified since it was generated')
+		return False
+
+	current = library_manifest(args, cellib, known)
+	for key, value in current.items():
+		if key in ('lef', 'spice'):
+			old_hashes = { name: rec['sha256'] for name, rec in known.get(key, dict()).items() }
+			new_hashes = { name: rec['sha256'] for name, rec in value.items() }
+			if old_hashes != new_hashes:
+				return False
+		elif known.get(key, None) != value:
+			return False
+
+	return True
+
+def _glob_match(name: str, include: list[str] | None, exclude: list[str] | None) -> bool:
+	if include is not None and not any(fnmatchcase(name, pattern) for pattern in include):
+		return False
+	return exclude is None or not any(fnmatchcase(name, pattern) for pattern in exclude)
+
+def library_selected(args: Namespace, name: str) -> bool:
+	''' Check the name of a cell library against the `--libs` and `--skip-libs` globs '''
+	return _glob_match(name, args.libs, args.skip_libs)
+
+def cell_selected(args: Namespace, name: str) -> bool:
+	''' Check the name of a MACRO against the `--cells` and `--skip-cells` globs '''
+	return _glob_match(name, args.cells, args.skip_cells)
+
+def filters_cells(args: Namespace) -> bool:
+	return args.cells is not None or args.skip_cells is not None
+
+def select_macros(lef: bytes | mmap, cellib: Path, args: Namespace) -> list[tuple[str, int, int]]:
+	'''
+	Find the MACROs in the raw LEF that match the cell filters, so the bodies of the
+	rest never get decoded or make it to the parser. This only looks at the `MACRO` lines.
+	'''
+
+	macros = split_macros(lef)
+	selected = [ macro for macro in macros if cell_selected(args, macro[0]) ]
+	log.info(f' ==> Selected {len(selected)} of {len(macros)} MACROs in \'{cellib.stem}\'')
+	return selected
+
+def read_lef(lef: bytes | mmap, cellib: Path, args: Namespace) -> Iterator[tuple[str, int, str]]:
+	''' Pull the MACROs out of a mapped LEF for `parse_macros`, or just the ones matching the cell filters if any '''
+	macros = select_macros(lef, cellib, args) if filters_cells(args) else split_macros(lef)
+	return macro_sources(lef, macros)
+
+# Every cell library seen by `scan_pdk` keyed by its path, and the (size, mtime) of every
+# file in them, so the caches can check if a file has changed without having to stat it again
+_inventory: dict[Path, CellLibrary] = dict()
+_file_stats: dict[Path, tuple[int, int]] = dict()
+
+def _file_stat(file: Path) -> tuple[int, int]:
+	known = _file_stats.get(file, None)
+	if known is not None:
+		return known
+	stat = file.stat()
+	return (stat.st_size, stat.st_mtime_ns)
+
+def _scan_library(reflib: Path, entry: DirEntry, kinds: tuple[str, ...]) -> CellLibrary:
+	library = CellLibrary(entry.name, reflib / entry.name, kinds)
+
+	with scandir(entry.path) as subdirs:
+		for subdir in subdirs:
+			if subdir.name not in library.files or not subdir.is_dir():
+				continue
+
+			suffix = f'.{subdir.name}'
+			files = list()
+			with scandir(subdir.path) as dir_entries:
+				for file in dir_entries:
+					if file.name.lower().endswith(suffix) and file.is_file():
+						stat = file.stat()
+						files.append((library.path / subdir.name / file.name, stat.st_size, stat.st_mtime_ns))
+			# Directory listings come back in whatever order the filesystem likes, so sort them to keep runs repeatable
+			library.files[subdir.name] = sorted(files)
+
+	return library
+
+def scan_pdk(args: Namespace, kinds: tuple[str, ...] = INVENTORY_KINDS) -> dict[str, CellLibrary] | None:
+	'''
+	Walk the `libs.ref` of a PDK once, and take an inventory of the given kinds of files in
+	each cell library along with their sizes and modification times. With more than one job the
+	libraries are scanned concurrently, which helps a lot when PDK_ROOT is on a network mount.
+	'''
+
+	PDK: str = args.pdk
+	PDK_ROOT: Path = args.pdk_root
+	JOBS: int = args.jobs
 	PDK_PATH   = (PDK_ROOT / PDK)
 	PDK_REFLIB = (PDK_PATH / 'libs.ref')
-	SKIP_SRAM: bool = args.skip_sram
-
-	spice_files = list()
 
-	log.info(f'Collecting SPICE files from \'{PDK}\'')
+	log.info(f'Scanning cell libraries in \'{PDK}\'')
 	log.debug(f'PDK_ROOT: {PDK_ROOT}, PDK: {PDK}')
 
-	if not PDK_PATH.exists() or not PDK_REFLIB.exists():
+	if not PDK_REFLIB.is_dir():
 		log.error(f'Unable to find PDK {PDK} in PDK_ROOT: {PDK_ROOT}')
 		return None
 
-	for cellib in PDK_REFLIB.iterdir():
-		log.info(f' => Found Cell library \'{cellib.name}\'')
+	with scandir(PDK_REFLIB) as entries:
+		cellibs = sorted((entry for entry in entries if entry.is_dir()), key = lambda entry: entry.name)
+
+	if JOBS > 1 and len(cellibs) > 1:
+		with ThreadPoolExecutor(max_workers = JOBS) as pool:
+			libraries = list(pool.map(lambda entry: _scan_library(PDK_REFLIB, entry, kinds), cellibs))
+	else:
+		libraries = [ _scan_library(PDK_REFLIB, entry, kinds) for entry in cellibs ]
+
+	inventory = dict()
+	for library in libraries:
+		log.info(f' => Found Cell library \'{library.name}\'')
+		log.debug(f' ==> {library}')
+		# This is logged here rather than in `_collect`, otherwise it'd be logged again for each kind of file
+		if not library_selected(args, library.name):
+			log.info(' ==> Excluded by the library filters, skipping')
+		inventory[library.name] = library
+		_inventory[library.path] = library
+		for files in library.files.values():
+			for file, size, mtime in files or []:
+				_file_stats[file] = (size, mtime)
+
+	log.info(f'Found {len(inventory)} cell libraries in {PDK}')
+	return inventory
+
+def _collect(args: Namespace, inventory: dict[str, CellLibrary], kind: str, desc: str) -> list[Path]:
+	SKIP_SRAM: bool = args.skip_sram
+
+	files = list()
+
+	for name, library in inventory.items():
+		if SKIP_SRAM and 'sram' in name.lower():
+			log.info(f' => Skipping cell library \'{name}\', likely contains SRAM cells')
+			continue
 
-		if SKIP_SRAM and 'sram' in cellib.name.lower():
-			log.info(' ==> Skipping cell library, likely contains SRAM cells')
+		if not library_selected(args, name):
 			continue
 
-		CELL_LEFS = (cellib / 'spice')
-		if not CELL_LEFS.exists():
-			log.warning(f' => Cell library \'{cellib.name}\' has no SPICE files, skipping...')
+		if library.files[kind] is None:
+			log.warning(f' => Cell library \'{name}\' has no {desc} files, skipping...')
 			continue
 
-		for spice in CELL_LEFS.iterdir():
-			if spice.suffix.lower() == '.spice':
-				log.debug(f' => Found SPICE file \'{spice}\'')
-				spice_files.append(spice)
+		for file, _, _ in library.files[kind]:
+			log.debug(f' => Found {desc} file \'{file}\'')
+			files.append(file)
+
+	return files
+
+def collect_spice(args: Namespace, inventory: dict[str, CellLibrary] | None = None) -> list[Path]:
+	PDK: str = args.pdk
+
+	log.info(f'Collecting SPICE files from \'{PDK}\'')
+
+	if inventory is None and (inventory := scan_pdk(args)) is None:
+		return None
+
+	spice_files = _collect(args, inventory, 'spice', 'SPICE')
 
 	log.info(f'Found {len(spice_files)} SPICE files for PDK')
 	return spice_files
 
 
-
-def collect_lefs(args: Namespace) -> list[Path]:
+def collect_lefs(args: Namespace, inventory: dict[str, CellLibrary] | None = None) -> list[Path]:
 	PDK: str = args.pdk
-	PDK_ROOT: Path = args.pdk_root
-	PDK_PATH   = (PDK_ROOT / PDK)
-	PDK_REFLIB = (PDK_PATH / 'libs.ref')
-	SKIP_SRAM: bool = args.skip_sram
-
-	lef_files = list()
+	SKIP_EXISTING: bool = args.skip_existing
 
 	log.info(f'Collecting LEF files from \'{PDK}\'')
-	log.debug(f'PDK_ROOT: {PDK_ROOT}, PDK: {PDK}')
 
-	if not PDK_PATH.exists() or not PDK_REFLIB.exists():
-		log.error(f'Unable to find PDK {PDK} in PDK_ROOT: {PDK_ROOT}')
+	if inventory is None and (inventory := scan_pdk(args)) is None:
 		return None
 
-	for cellib in PDK_REFLIB.iterdir():
-		log.info(f' => Found Cell library \'{cellib.name}\'')
+	lef_files = _collect(args, inventory, 'lef', 'LEF')
 
-		if SKIP_SRAM and 'sram' in cellib.name.lower():
-			log.info(' ==> Skipping cell library, likely contains SRAM cells')
-			continue
+	log.info(f'Found {len(lef_files)} LEF files for PDK')
 
-		CELL_LEFS = (cellib / 'lef')
-		if not CELL_LEFS.exists():
-			log.warning(f' => Cell library \'{cellib.name}\' has no LEF files, skipping...')
-			continue
+	if SKIP_EXISTING and args.cache_dir is None:
+		log.warning('--skip-existing needs the build manifests from the cache, regenerating everything')
+	elif SKIP_EXISTING:
+		manifest = load_manifest(args, _symlib_path(args, lef_files[0]).parent) if len(lef_files) > 0 else dict()
+		stale = list()
+		for lef in lef_files:
+			if is_up_to_date(args, lef, manifest):
+				log.info(f' => Skipping \'{lef.stem}\', symbol library is up to date')
+			else:
+				stale.append(lef)
 
-		for lef in CELL_LEFS.iterdir():
-			if lef.suffix.lower() == '.lef':
-				log.debug(f' => Found LEF file \'{lef}\'')
-				lef_files.append(lef)
+		log.info(f'{len(lef_files) - len(stale)} LEF files are up to date, {len(stale)} need regenerating')
+		lef_files = stale
 
-	log.info(f'Found {len(lef_files)} LEF files for PDK')
 	return lef_files
 
-def process_lefs(args: Namespace, lefs: list[Path]) -> list[tuple[list[Cell], Path]]:
+# When generating multiple PDKs, the parsed LEF and SPICE files keyed by their content hash,
+# a lot of the libraries are identical between PDK variants so there's no need to parse them again
+_parse_memo: dict[str, list[Macro] | dict[str, Subckt]] | None = None
+
+# The per-process LEF model used by pool workers, see `_init_worker`
+_worker_model = None
+
+def _init_worker(args: Namespace, model) -> None:
+	global _worker_model
+	_setup_logging(args)
+	setup_templates(args)
+	_worker_model = model
+
+def _worker_name() -> str:
+	# Workers in a process pool are told apart by their PID, and in a thread pool by their thread
+	if parent_process() is not None:
+		return f'pid {getpid()}'
+	return current_thread().name
+
+def _parse_chunk(
+	sources: list[tuple[str, int, str]], cellib: Path, args: Namespace
+) -> tuple[list[Macro], float, str, float, list[tuple[str, int, str, bool]]]:
+	started = time()
+	start = perf_counter()
+	errors = list()
+	macros = parse_macros(_worker_model, sources, cellib, args, errors)
+	return (macros, perf_counter() - start, _worker_name(), started, errors)
+
+def _make_pool(args: Namespace, model = None) -> Executor:
+	JOBS: int = args.jobs
+
+	if args.pool == 'process':
+		# The LEF pool is started from a pipeline thread while others are busy logging, and forking a
+		# multithreaded process can leave the workers with locks (like the console's) that are never released
+		method = 'forkserver' if 'forkserver' in get_all_start_methods() else 'spawn'
+		return ProcessPoolExecutor(
+			max_workers = JOBS,
+			mp_context  = get_context(method),
+			initializer = _init_worker,
+			initargs    = (args, model)
+		)
+
+	global _worker_model
+	_worker_model = model
+	return ThreadPoolExecutor(max_workers = JOBS)
+
+def _chunk_lef(lef: bytes | mmap, cellib: Path, args: Namespace) -> list[list[tuple[str, int, str]]]:
+	# The chunks are sent off to the pool workers, so unlike elsewhere the MACROs all have to be decoded up front
+	sources = list(read_lef(lef, cellib, args))
+	return [ sources[idx:idx + LEF_CHUNK_MACROS] for idx in range(0, len(sources), LEF_CHUNK_MACROS) ]
+
+def _memo_key(file: Path) -> str | None:
+	if _parse_memo is None:
+		return None
+	return _file_digest(file)['sha256']
+
+def _finish_cellib(
+	args: Namespace, cellib: Path, macros: list[Macro] | None, key: str | None, db: sqlite3.Connection | None,
+	parsed: bool, errors: list[tuple[str, int, str, bool]] = ()
+) -> tuple[list[Cell] | None, Path]:
+	PDK: str = args.pdk
+	PARSER: str = args.parser
+	FILTER_CELLS: bool = filters_cells(args)
+
+	if macros is None:
+		return (None, cellib)
+
+	if len(errors) > 0:
+		profiler.add_parse_errors(PDK, cellib.stem, errors)
+
+	# When filtering cells only some of the MACROs were parsed, so they can't stand in for the whole library,
+	# and libraries with MACROs that failed to parse aren't kept either so they're retried (and reported) next time
+	complete = not (parsed and (FILTER_CELLS or len(errors) > 0))
+
+	if parsed and complete and db is not None:
+		store_macros(db, key, PARSER, cellib, macros)
+
+	if _parse_memo is not None and complete:
+		_parse_memo[key] = macros
+
+	if FILTER_CELLS:
+		macros = [ macro for macro in macros if cell_selected(args, macro.name) ]
+
+	cells, bounds = build_cells(macros, cellib, args)
+	log.info(f' ==> Found {len(cells)} cells in {cellib.stem}')
+	inject_primitives(cells, cellib, args, bounds)
+	profiler.count(PDK, cellib.stem, cells = len(cells), pins = sum(cell.pin_count() for cell in cells))
+	return (cells, cellib)
+
+def process_lefs(args: Namespace, lefs: list[Path]) -> Iterator[tuple[list[Cell] | None, Path]]:
+	'''
+	Parse the given LEFs and turn them into cells, yielding each cell library as soon
+	as it's ready so the later stages can get started on it.
+	'''
+
 	PDK: str = args.pdk
 	JOBS: int = args.jobs
+	PARSER: str = args.parser
 
 	log.info('Processing LEFs')
 
-	log.info('Compiling TatSu parser, this might take a minute')
-	with TATSU_LEF_GRAMMAR.open('r') as lef_grammar:
-		model = tatsu.compile(''.join(lef_grammar.readlines()))
+	# Cross checking needs the LEFs to actually be parsed, so skip the database entirely
+	db = open_macro_db(args) if not args.cross_check else None
+	keys = {
+		cellib: _file_digest(cellib)['sha256'] if db is not None or _parse_memo is not None else None
+		for cellib in lefs
+	}
+	# Only which libraries are cached is worked out up front, each one is loaded as it's handed on
+	# so the number held in memory at once is still bounded by how far ahead the pipeline can get
+	cached = [
+		cellib for cellib, key in keys.items() if key is not None and (
+			(_parse_memo is not None and key in _parse_memo) or (db is not None and has_macros(db, key, PARSER))
+		)
+	]
 
-	log.info('Processing cell libraries, this will take a while.')
+	sizes = { cellib: _file_stat(cellib)[0] for cellib in lefs }
+	for cellib, size in sizes.items():
+		profiler.count(PDK, cellib.stem, bytes_in = size)
 
-	def _process_cell_lib(cellib: Path):
-		log.info(f' => Processing Cell Library \'{PDK}/{cellib.stem}\'')
-		cells = extract(model, cellib, args)
-		return (cells, cellib)
+	# Parse time is more or less proportional to the size of the LEF, so start on the biggest libraries
+	# first, otherwise one big library being picked up last can leave it running long after everything else
+	uncached = set(lefs).difference(cached)
+	pending = sorted(
+		( cellib for cellib in lefs if cellib in uncached ), key = lambda cellib: sizes[cellib], reverse = True
+	)
 
-	cellibs = list()
-	if JOBS == 1:
-		for cellib in lefs:
-			cellibs.append(_process_cell_lib(cellib))
-	else:
-		futures = list()
-		with ThreadPoolExecutor(max_workers = JOBS) as pool:
-			for cellib in lefs:
-				futures.append(pool.submit(
-					_process_cell_lib, cellib
-				))
+	try:
+		for cellib in cached:
+			key = keys[cellib]
+			if _parse_memo is not None and key in _parse_memo:
+				log.info(f' => Reusing parsed Cell Library \'{cellib.stem}\' from a previous PDK')
+				macros = _parse_memo[key]
+			elif (macros := load_macros(db, key, PARSER)) is not None:
+				log.info(f' => Loaded Cell Library \'{cellib.stem}\' from the MACRO database')
+			else:
+				# It couldn't be read back after all, so it'll just have to be parsed again
+				pending.append(cellib)
+				continue
+			yield _finish_cellib(args, cellib, macros, keys[cellib], db, False)
+
+		model = None
+		if len(pending) > 0 and (args.parser != 'fast' or args.cross_check):
+			model = load_lef_model(args)
+
+		if len(pending) > 0:
+			log.info('Processing cell libraries, this will take a while.')
+
+		if JOBS == 1:
+			for cellib in pending:
+				log.info(f' => Processing Cell Library \'{PDK}/{cellib.stem}\'')
+				errors = list()
+				with profiler.stage(PDK, 'parse', cellib.stem):
+					macros = parse_lef(model, cellib, args, errors)
+				yield _finish_cellib(args, cellib, macros, keys[cellib], db, True, errors)
+		elif len(pending) > 0:
+			queued = iter(pending)
+			jobs = deque()
+			spans = list()
+			with _make_pool(args, model) as pool:
+				while True:
+					# Only keep a few libraries in flight, enough to keep all the workers busy
+					# without parsing the whole PDK ahead of whatever is consuming the cells
+					while len(jobs) < JOBS + PIPELINE_DEPTH and (cellib := next(queued, None)) is not None:
+						log.info(f' => Processing Cell Library \'{PDK}/{cellib.stem}\'')
+						with map_input(cellib) as lef:
+							chunks = _chunk_lef(lef, cellib, args)
+
+						if len(chunks) > 1:
+							log.debug(f' ==> Split \'{cellib.stem}\' into {len(chunks)} jobs')
+
+						jobs.append((cellib, [
+							pool.submit(_parse_chunk, chunk, cellib, args) for chunk in chunks
+						]))
+
+					if len(jobs) == 0:
+						break
+
+					cellib, futures = jobs.popleft()
+					results = [ f.result() for f in futures ]
+					spans.extend((worker, started, elapsed) for _, elapsed, worker, started, _ in results)
+					# This is the time spent parsing across all of the workers, not wall time
+					profiler.add(PDK, 'parse', sum(elapsed for _, elapsed, _, _, _ in results), cellib.stem)
+					macros = [ macro for res, _, _, _, _ in results for macro in res ]
+					errors = [ err for _, _, _, _, errs in results for err in errs ]
+					yield _finish_cellib(args, cellib, macros, keys[cellib], db, True, errors)
+
+			log.info(f' => LEF worker utilization: {profiler.add_worker_spans(PDK, "parse", spans)}')
+	finally:
+		if db is not None:
+			db.close()
+
+def scan_subckts(netlist: Path) -> Iterator[Subckt]:
+	'''
+	Find all of the `.subckt` ... `.ends` blocks in a SPICE netlist.
+
+	This is a single pass over the lines of the file, comments and `+` continuations
+	are skipped over and only the byte offsets of each subckt are recorded.
+	'''
+
+	# The (name, offset) of any currently open subckts, they can technically be nested
+	stack: list[list[str | None, int]] = list()
+	offset = 0
+
+	with netlist.open('rb') as f:
+		for line in f:
+			start = offset
+			offset += len(line)
+
+			head = line[:1]
+			if head == b'*':
+				continue
+
+			if head == b'+':
+				# The subckt name can be on a continuation line
+				if len(stack) > 0 and stack[-1][0] is None and len(toks := line[1:].split()) > 0:
+					stack[-1][0] = toks[0].decode('utf-8')
+				continue
+
+			if (subckt := SUBCKT_START_REGEX.match(line)) is not None:
+				name = subckt.group(1)
+				stack.append([
+					name.decode('utf-8') if name is not None else None,
+					start + len(line) - len(line.lstrip())
+				])
+			elif len(stack) > 0 and SUBCKT_END_REGEX.match(line) is not None:
+				name, begin = stack.pop()
+				if name is None:
+					log.warning(f'Unnamed subckt at byte {begin} in \'{netlist.name}\'')
+					continue
+				yield Subckt(name, netlist, begin, start + len(line.rstrip(b'\r\n')) - begin)
+
+	for name, _ in stack:
+		log.warning(f'Subckt \'{name}\' in \'{netlist.name}\' is missing its \'.ends\'')
 
-		cellibs = list(map(lambda f: f.result(), futures))
-	return cellibs
+def _parse_spice(netlist: Path) -> dict[str, Subckt]:
+	return { subckt.name: subckt for subckt in scan_subckts(netlist) }
 
-def process_spices(args: Namespace, spices: list[Path]) -> list[tuple[Path, dict[str, str]]]:
+def _process_spice(netlist: Path, args: Namespace) -> tuple[Path, dict[str, Subckt], float, str, float]:
 	PDK: str = args.pdk
-	JOBS: int = args.jobs
 
-	subckt_regex = re.compile(r'(\.subckt\s+([\w\d]+)\s+([\w\d\s]+)\n([\w\d\s#+=.]+\n)+\.ends)\n')
+	log.info(f' => Processing SPICE netlist \'{PDK}/{netlist.stem}\'')
+
+	started = time()
+	start = perf_counter()
+	spices = _parse_spice(netlist)
+
+	log.info(f' ==> Found {len(spices)} subckts in {netlist.stem}')
+	return (netlist, spices, perf_counter() - start, _worker_name(), started)
+
+def _spice_index_path(args: Namespace) -> Path | None:
+	CACHE: Path | None = args.cache_dir
+	if CACHE is None:
+		return None
+
+	key = hashlib.sha256(f'{args.pdk_root.resolve() / args.pdk}'.encode('utf-8')).hexdigest()[:16]
+	return (CACHE / f'spice-{key}.pickle')
+
+def load_spice_index(args: Namespace) -> dict[str, tuple[int, int, list[tuple[str, int, int]]]]:
+	'''
+	Load the on-disk index of every subckt in the PDK.
+
+	This maps each netlist to its (mtime, size, subckts), where each subckt is
+	a (name, offset, length) so netlists that haven't changed don't get re-read.
+	'''
+
+	INDEX = _spice_index_path(args)
+	if INDEX is None or not INDEX.exists():
+		return dict()
+
+	try:
+		with INDEX.open('rb') as f:
+			generator, index = pickle.load(f)
+	except Exception as e:
+		log.warning(f'Unable to load cached SPICE index ({e}), rebuilding')
+		return dict()
+
+	# Any change to the scanner could change what's in the index
+	if generator != _get_generator_digest():
+		return dict()
+	return index
+
+def save_spice_index(args: Namespace, index: dict[str, tuple[int, int, list[tuple[str, int, int]]]]) -> None:
+	INDEX = _spice_index_path(args)
+	if INDEX is None:
+		return
+
+	log.debug(f' => Caching SPICE index to \'{INDEX}\'')
+	try:
+		INDEX.parent.mkdir(exist_ok = True, parents = True)
+		tmp = INDEX.with_suffix(f'.{getpid()}.tmp')
+		with tmp.open('wb') as f:
+			pickle.dump((_get_generator_digest(), index), f)
+		tmp.replace(INDEX)
+	except OSError as e:
+		log.warning(f'Unable to cache SPICE index: {e}')
+
+def process_spices(args: Namespace, spices: list[Path]) -> list[tuple[Path, dict[str, Subckt]]]:
+	PDK: str = args.pdk
+	JOBS: int = args.jobs
 
 	log.info('Processing SPICE netlists')
 
-	def _process_spice(netlist: Path) -> tuple[Path, dict[str, str]]:
-		log.info(f' => Processing SPICE netlist \'{PDK}/{netlist.stem}\'')
+	index = load_spice_index(args)
+	stats = { netlist: _file_stat(netlist) for netlist in spices }
+	parsed: dict[Path, dict[str, Subckt]] = dict()
 
-		with netlist.open('r') as f:
-			spice = ''.join(f.readlines())
+	for netlist, (size, mtime) in stats.items():
+		known = index.get(str(netlist), None)
+		if known is not None and known[:2] == (mtime, size):
+			parsed[netlist] = {
+				name: Subckt(name, netlist, offset, length) for name, offset, length in known[2]
+			}
 
-		spices = dict()
+	if len(parsed) > 0:
+		log.info(f' => Found {len(parsed)} unchanged SPICE netlists in the index')
 
-		for subckt in subckt_regex.finditer(spice):
-			full = subckt.group(1)
-			name = subckt.group(2)
-			spices[name] = full
+	keys = { netlist: _memo_key(netlist) for netlist in spices if netlist not in parsed }
+	memoized = 0
+	for netlist, key in keys.items():
+		if key is not None and key in _parse_memo:
+			# The memo might be from another PDK, so the subckts need pointing at this netlist
+			parsed[netlist] = {
+				name: Subckt(name, netlist, subckt.offset, subckt.length)
+				for name, subckt in _parse_memo[key].items()
+			}
+			memoized += 1
 
-		log.info(f' ==> Found {len(spices)} subckts in {netlist.stem}')
-		return (netlist, spices)
+	if memoized > 0:
+		log.info(f' => Reusing {memoized} parsed SPICE netlists from a previous PDK')
 
-	spicelibs = list()
+	pending = [ netlist for netlist in spices if netlist not in parsed ]
+
+	for netlist, (size, _) in stats.items():
+		profiler.count(PDK, netlist.parent.parent.name, bytes_in = size)
+
+	results = list()
 	if JOBS == 1:
-		for netlist in spices:
-			spicelibs.append(_process_spice(netlist))
-	else:
+		for netlist in pending:
+			results.append(_process_spice(netlist, args))
+	elif len(pending) > 0:
 		futures = list()
-		with ThreadPoolExecutor(max_workers = JOBS) as pool:
-			for netlist in spices:
+		with _make_pool(args) as pool:
+			# Like the LEFs, the biggest netlists go first so they're not left running on their own at the end
+			for netlist in sorted(pending, key = lambda netlist: stats[netlist][0], reverse = True):
 				futures.append(pool.submit(
-					_process_spice, netlist
+					_process_spice, netlist, args
 				))
-		spicelibs = list(map(lambda f: f.result(), futures))
+		results = [ f.result() for f in futures ]
+		spans = [ (worker, started, elapsed) for _, _, elapsed, worker, started in results ]
+		log.info(f' => SPICE worker utilization: {profiler.add_worker_spans(PDK, "spice", spans)}')
+
+	for netlist, subckts, elapsed, _, _ in results:
+		profiler.add(PDK, 'parse', elapsed, netlist.parent.parent.name)
+		parsed[netlist] = subckts
+
+	spicelibs = list()
+	for netlist in spices:
+		if keys.get(netlist, None) is not None:
+			_parse_memo[keys[netlist]] = parsed[netlist]
+		spicelibs.append((netlist, parsed[netlist]))
+
+	if len(keys) > 0:
+		for netlist, (size, mtime) in stats.items():
+			index[str(netlist)] = (
+				mtime, size,
+				[ (subckt.name, subckt.offset, subckt.length) for subckt in parsed[netlist].values() ]
+			)
+		save_spice_index(args, index)
+
 	return spicelibs
 
+def build_subckt_index(spicelibs: list[tuple[Path, dict[str, Subckt]]]) -> dict[str, list[Subckt]]:
+	''' Map every subckt name to all of its definitions across the netlists, in netlist path order '''
+	subckts = dict()
+	for _, models in sorted(spicelibs, key = lambda spicelib: spicelib[0]):
+		for name, subckt in models.items():
+			subckts.setdefault(name, list()).append(subckt)
+	return subckts
+
+def resolve_subckt(subckts: dict[str, list[Subckt]], name: str, cellib: Path) -> Subckt | None:
+	'''
+	Pick which definition of a subckt to use for a cell. Definitions from the cell library's own netlists
+	are preferred over ones from elsewhere in the PDK, and within those a netlist named after the subckt.
+	'''
+
+	defs = subckts.get(name, None)
+	if defs is None:
+		return None
+	if len(defs) == 1:
+		return defs[0]
+
+	CELL_SPICE = (cellib.parent.parent / 'spice')
+	local = [ subckt for subckt in defs if subckt.netlist.parent == CELL_SPICE ]
+	candidates = local if len(local) > 0 else defs
+
+	for subckt in candidates:
+		if subckt.netlist.stem == name:
+			return subckt
+
+	if len(candidates) > 1:
+		log.warning(
+			f'Subckt \'{name}\' is defined in {len(candidates)} netlists, using \'{candidates[0].netlist.name}\''
+		)
+		log.debug(f' => Also in {", ".join(subckt.netlist.name for subckt in candidates[1:])}')
+
+	return candidates[0]
+
 def merge_spice(
-	args: Namespace, cellibs: list[tuple[list[Cell], Path]],
-	spicelibs:  list[tuple[Path, dict[str, str]]]
-) -> None:
+	args: Namespace, cellibs: Iterable[tuple[list[Cell] | None, Path]], subckts: dict[str, list[Subckt]]
+) -> Iterator[tuple[list[Cell] | None, Path]]:
+	PDK_ROOT: Path = args.pdk_root
 	PDK: str = args.pdk
 	LINK_SPICE: bool = args.dont_link
 
 	log.info('Merging SPICE netlists into symbols')
 
-	netlists = dict()
 	total = 0
 	unk = 0
 
-	for f, model in spicelibs:
-		netlists[f.stem] = model
-
 	for cells, cellib in cellibs:
-		# sky130_fd_pr is a special case where rather than one monolithic spice model,
-		# everything is broken out, and there is a lot of other stuff, due to it being
-		# the core primitive models and the like.
+		if cells is None:
+			yield (cells, cellib)
+			continue
 
-		# Therefore, it needs to be speical cased below, it's kinda anoying but it works
+		with profiler.stage(PDK, 'merge', cellib.stem):
+			# Models are looked up by name across every netlist in the PDK, which matters
+			# for sky130_fd_pr where rather than one monolithic spice model, everything
+			# is broken out into a lot of smaller netlists.
+			found = 0
+			netlists = set()
 
-		if cellib.stem == 'sky130_fd_pr':
 			for cell in cells:
 				total += 1
 				CELL_NAME = f'{cellib.stem}__{cell.id}'
-
-				# BUG(aki): This excludes a handfull of cells due to them being in
-				# a different SPICE file, should be fixed, but it's not a big deal right now.
-				if CELL_NAME not in netlists:
-					log.warning(f'No SPICE lib found for primitive cell \'{CELL_NAME}\'')
-					continue
-
-				if LINK_SPICE:
-					SPICE_LIB = f'${{PDK_ROOT}}/{PDK}/libs.ref/{cellib.stem}/spice/{CELL_NAME}.spice'
-
 				log.debug(f'Looking for model for {CELL_NAME}')
-				model = netlists[CELL_NAME].get(CELL_NAME, None)
+				model = resolve_subckt(subckts, CELL_NAME, cellib)
 				if model is None:
 					unk += 1
 					continue
 
+				found += 1
+				netlists.add(model.netlist)
 				if LINK_SPICE:
-					cell.append_property(Property('Sim.Library', SPICE_LIB, 90))
-					cell.append_property(Property('Sim.Name',    CELL_NAME, 91))
-					cell.append_property(Property('Sim.Device',  'SUBCKT',  92))
+					SPICE_LIB = f'${{PDK_ROOT}}/{model.netlist.relative_to(PDK_ROOT).as_posix()}'
+					cell.append_property(shared_property('Sim.Library', SPICE_LIB, 90))
+					cell.append_property(Property('Sim.Name',           CELL_NAME, 91))
+					cell.append_property(shared_property('Sim.Device',  'SUBCKT',  92))
 				else:
-					cell.append_property(Property('Sim.Device',  'SPICE', 92))
+					cell.append_property(shared_property('Sim.Device',  'SPICE', 92))
 					cell.append_property(Property(
-						'Sim.Params',  f'model=\\"{model.encode("unicode_escape").decode("utf-8")}\\"', 93
+						'Sim.Params',  f'model=\\"{model.body.encode("unicode_escape").decode("utf-8")}\\"', 93
 					))
-		else:
-			if cellib.stem not in netlists:
-				log.warning(f'No SPICE lib found for cell library \'{cellib.stem}\'')
-				continue
 
-			if LINK_SPICE:
-				SPICE_LIB = f'${{PDK_ROOT}}/{PDK}/libs.ref/{cellib.stem}/spice/{cellib.stem}.spice'
+			if len(cells) > 0 and found == 0:
+				log.warning(f'No SPICE models found for cell library \'{cellib.stem}\'')
+			_resolved_netlists[cellib] = netlists
 
-			for cell in cells:
-				total += 1
-				CELL_NAME = f'{cellib.stem}__{cell.id}'
-				log.debug(f'Looking for model for {CELL_NAME}')
-				model = netlists[cellib.stem].get(CELL_NAME, None)
-				if model is None:
-					unk += 1
-					continue
-
-				if LINK_SPICE:
-					cell.append_property(Property('Sim.Library', SPICE_LIB, 90))
-					cell.append_property(Property('Sim.Name',    CELL_NAME, 91))
-					cell.append_property(Property('Sim.Device',  'SUBCKT',  92))
-				else:
-					cell.append_property(Property('Sim.Device',  'SPICE', 92))
-					cell.append_property(Property(
-						'Sim.Params',  f'model=\\"{model.encode("unicode_escape").decode("utf-8")}\\"', 93
-					))
+		yield (cells, cellib)
 
 	log.info(f'Merged {total - unk} SPICE models with matching cells (Total: {total}, No Models: {unk})')
 
 
-def emit_symlibs(args: Namespace, cellibs: tuple[list[Cell], Path]) -> bool:
-	OUTDIR: Path = args.outdir
+def _write_symlib_sexpr(sym: TextIO, cells: list[Cell], compact: bool) -> None:
+	sym.write('(kicad_symbol_lib (version 20211014) (generator pdk2kicad)\n')
+	for cell in cells:
+		sym.write('  ')
+		sym.write(cell.to_sexpr(compact))
+		sym.write('\n')
+	sym.write(')')
+
+def _symlib_symbols(symlib: Path) -> dict[str, tuple[str, ...]]:
+	''' Pull the tokens for each top-level symbol out of a symbol library, so they can be compared ignoring formatting '''
+	with symlib.open('r') as f:
+		tokens = SEXPR_TOKEN_REGEX.findall(f.read())
+
+	symbols = dict()
+	depth = 0
+	start = None
+
+	for idx, tok in enumerate(tokens):
+		if tok == '(':
+			depth += 1
+			if depth == 2 and idx + 2 < len(tokens) and tokens[idx + 1] == 'symbol':
+				start = idx
+		elif tok == ')':
+			if depth == 2 and start is not None:
+				symbols[tokens[start + 2].strip('"')] = tuple(tokens[start:idx + 1])
+				start = None
+			depth -= 1
+
+	return symbols
+
+def _symlib_spans(text: str) -> tuple[list[tuple[str, int, int]], int]:
+	''' The (name, start, end) of each top-level symbol in the text of a symbol library, and where it's closed '''
+	spans = list()
+	close = len(text)
+	depth = 0
+	start = None
+	name = None
+	head = 0
+
+	for match in SEXPR_TOKEN_REGEX.finditer(text):
+		tok = match.group(0)
+		if tok == '(':
+			depth += 1
+			if depth == 2:
+				start, name, head = match.start(), None, 2
+		elif tok == ')':
+			if depth == 2 and start is not None and name is not None:
+				spans.append((name, start, match.end()))
+				start = None
+			elif depth == 1:
+				close = match.start()
+			depth -= 1
+		elif depth == 2 and head > 0:
+			# The first two tokens of a symbol are `symbol` and then its name
+			head -= 1
+			if head == 1 and tok != 'symbol':
+				start, head = None, 0
+			elif head == 0:
+				name = tok.strip('"')
+
+	return (spans, close)
+
+def merge_symlibs(old: Path, new: Path) -> int:
+	'''
+	Merge the symbols of the newly rendered library `new` into the existing library `old`, replacing the ones
+	with the same name in place and adding the rest at the end. The result is written back over `new`, and
+	the number of symbols that were replaced is returned.
+
+	KiCad won't load a symbol that `extends` one that comes after it, so a new symbol that's the base
+	of an existing one is put in front of it rather than at the end.
+	'''
+
+	old_text = old.read_text()
+	new_text = new.read_text()
+
+	new_spans, _ = _symlib_spans(new_text)
+	symbols = { name: new_text[start:end] for name, start, end in new_spans }
+	old_spans, close = _symlib_spans(old_text)
+
+	merged = list()
+	placed = set()
+	replaced = 0
+	pos = 0
+	for name, start, end in old_spans:
+		if name in placed:
+			# It was already moved up in front of a symbol derived from it
+			merged.append(old_text[pos:start])
+			pos = end
+			replaced += 1
+			continue
+
+		symbol = symbols.pop(name, None)
+		base = SEXPR_EXTENDS_REGEX.search(symbol if symbol is not None else old_text[start:end])
+		if base is not None and (base := base.group(1)) in symbols:
+			merged.append(old_text[pos:start])
+			merged.append(f'{symbols.pop(base)}\n  ')
+			placed.add(base)
+			pos = start
+
+		if symbol is not None:
+			merged.append(old_text[pos:start])
+			merged.append(symbol)
+			pos = end
+			replaced += 1
+
+	merged.append(old_text[pos:close])
+	merged.extend(f'  {symbol}\n' for symbol in symbols.values())
+	merged.append(old_text[close:])
+
+	with new.open('w', buffering = SYMLIB_WRITE_BUFFER) as f:
+		f.write(''.join(merged))
+
+	return replaced
+
+def diff_symlibs(old: Path, new: Path) -> tuple[list[str], list[str], list[str]] | None:
+	'''
+	Compare two symbol libraries, returning the names of the symbols that were added,
+	removed, and modified, or `None` if they are identical apart from their formatting.
+	'''
+
+	old_symbols = _symlib_symbols(old)
+	new_symbols = _symlib_symbols(new)
+
+	added    = [ name for name in new_symbols if name not in old_symbols ]
+	removed  = [ name for name in old_symbols if name not in new_symbols ]
+	modified = [
+		name for name, tokens in new_symbols.items() if name in old_symbols and old_symbols[name] != tokens
+	]
+
+	if len(added) == 0 and len(removed) == 0 and len(modified) == 0:
+		return None
+	return (added, removed, modified)
+
+def _summarize_names(names: list[str], limit: int = 8) -> str:
+	if len(names) <= limit or log.getLogger().isEnabledFor(log.DEBUG):
+		return ', '.join(names)
+	return f'{", ".join(names[:limit])}, and {len(names) - limit} more'
+
+def derive_variants(cells: list[Cell]) -> int:
+	'''
+	Point every cell that has the same pins as an earlier cell in the library at it,
+	so they get emitted using `extends` rather than repeating all of the graphics.
+	'''
+
+	bases: dict[int, Cell] = dict()
+	derived = 0
+
+	for cell in cells:
+		cell.base = None
+		base = bases.get(id(cell._layout), None)
+		if base is not None and cell.can_derive_from(base):
+			cell.base = base
+			derived += 1
+		elif base is None and cell._template() == CELL_TEMPLATE_CELL:
+			bases[id(cell._layout)] = cell
+
+	return derived
+
+def emit_symlibs(args: Namespace, cellibs: Iterable[tuple[list[Cell] | None, Path]]) -> bool:
 	PDK: str = args.pdk
-	FLATTEN: bool = args.flatten
+	BACKEND: str = args.backend
+	COMPACT: bool = args.compact
+	EXTENDS: bool = args.extends
+	ONLY_CHANGED: bool = args.only_changed
+	FILTER_CELLS: bool = filters_cells(args)
 
-	if not FLATTEN:
-		OUTDIR = (OUTDIR / PDK)
+	if COMPACT and BACKEND != 'sexpr':
+		log.warning('--compact is only supported by the sexpr backend, ignoring')
+
+	manifests = dict()
+	rendered = 0
+	failed = 0
+	unchanged = list()
+	_render_time = 0.0
 
 	for cells, cellib in cellibs:
-		if FLATTEN:
-			KISYM_LIB = (OUTDIR / f'{PDK}_{cellib.stem}.kicad_sym')
-		else:
-			KISYM_LIB = (OUTDIR / f'{cellib.stem}.kicad_sym')
+		if cells is None:
+			log.error(f'Unable to extract any cells from \'{cellib.stem}\', not writing a symbol library')
+			failed += 1
+			continue
+
+		if FILTER_CELLS and len(cells) == 0:
+			log.info(f' => No cells in \'{cellib.stem}\' matched the cell filters, leaving its symbol library alone')
+			continue
+
+		KISYM_LIB = _symlib_path(args, cellib)
+		OUTDIR = KISYM_LIB.parent
 
 		if not OUTDIR.exists():
 			OUTDIR.mkdir(exist_ok = True, parents = True)
 
 		log.info(f' => Writing KiCad symbols to \'{KISYM_LIB.name}\'')
 
-		log.debug(' ==> Rendering Symbol Library')
+		if EXTENDS:
+			derived = derive_variants(cells)
+			log.info(f' ==> {derived} of {len(cells)} symbols are derived from another symbol')
+
+		# Everything is written to a temporary file first and then moved into place, so
+		# KiCad (or an interrupted run) never sees a half written library.
+		TMP_LIB = KISYM_LIB.with_name(f'.{KISYM_LIB.name}.{getpid()}.tmp')
+
+		try:
+			log.debug(f' ==> Rendering Symbol Library to \'{KISYM_LIB}\'')
+			_emit_start = perf_counter()
+			with TMP_LIB.open('w', buffering = SYMLIB_WRITE_BUFFER) as f:
+				sym = _TimedWriter(f)
+				if BACKEND == 'sexpr':
+					renders = _fragment_renders
+					_write_symlib_sexpr(sym, cells, COMPACT)
+					# FETs are rendered from their templates, so they don't count towards the cache
+					bodies = sum(1 for cell in cells if cell._template() == CELL_TEMPLATE_CELL)
+					profiler.count(
+						PDK, cellib.stem,
+						fragment_hits = bodies - (_fragment_renders - renders), fragment_misses = _fragment_renders - renders
+					)
+				else:
+					# The library is streamed out as it's rendered rather than being built up as one big
+					# string first, so only a handful of symbols are ever held in memory at once.
+					symfile = get_template(KISYM_TEMPLATE).stream(
+						name     = cellib.stem,
+						lef_file = cellib.name,
+						symbols  = cells
+					)
+					symfile.enable_buffering(SYMLIB_STREAM_CHUNK)
+					symfile.dump(sym)
+				sym.write('\n')
+				sym.flush()
+
+			# Only the selected cells were rendered, so rather than replacing the whole library they're merged into it
+			if FILTER_CELLS and KISYM_LIB.exists():
+				replaced = merge_symlibs(KISYM_LIB, TMP_LIB)
+				log.info(f' ==> Merged into the existing library, {replaced} replaced and {len(cells) - replaced} added')
+			rendered += len(cells)
+			_render_time += perf_counter() - _emit_start
+
+			profiler.add(PDK, 'write', sym.elapsed, cellib.stem)
+			profiler.add(PDK, 'render', perf_counter() - _emit_start - sym.elapsed, cellib.stem)
+			profiler.count(PDK, cellib.stem, bytes_out = TMP_LIB.stat().st_size)
+
+			if OUTDIR not in manifests:
+				manifests[OUTDIR] = load_manifest(args, OUTDIR)
+
+			manifest = manifests[OUTDIR]
+			known = manifest.get(KISYM_LIB.name, None)
+
+			if ONLY_CHANGED and KISYM_LIB.exists() and not _symlib_changed(KISYM_LIB, TMP_LIB):
+				TMP_LIB.unlink()
+				unchanged.append(KISYM_LIB.name)
+			else:
+				TMP_LIB.replace(KISYM_LIB)
+		except BaseException:
+			# Don't leave a half written library lying around in the output directory
+			TMP_LIB.unlink(missing_ok = True)
+			raise
+
+		entry = library_manifest(args, cellib, known, _resolved_netlists.get(cellib, ()))
+		entry['output'] = _file_digest(KISYM_LIB, known.get('output', None) if known is not None else None)
+		manifest[KISYM_LIB.name] = entry
+
+	for outdir, manifest in manifests.items():
+		save_manifest(args, outdir, manifest)
+
+	if rendered > 0 and _render_time > 0:
+		log.info(f'Generated {rendered} symbols ({rendered / _render_time:.0f} symbols/s)')
+
+	if ONLY_CHANGED:
+		log.info(f'{len(unchanged)} symbol libraries were unchanged and left alone')
+		for name in unchanged:
+			log.debug(f' => \'{name}\'')
+
+	return failed == 0
+
+def _symlib_changed(old: Path, new: Path) -> bool:
+	''' Check if the newly rendered symbol library is any different from what's already there, logging what changed '''
+	if old.stat().st_size == new.stat().st_size and _hash_file(old) == _hash_file(new):
+		return False
+
+	diff = diff_symlibs(old, new)
+	if diff is None:
+		log.info(f' ==> \'{old.name}\' only differs in formatting, leaving it alone')
+		return False
+
+	added, removed, modified = diff
+	log.info(
+		f' ==> \'{old.name}\' changed: {len(added)} added, {len(removed)} removed, {len(modified)} modified'
+	)
+	for kind, names in (('Added', added), ('Removed', removed), ('Modified', modified)):
+		if len(names) > 0:
+			log.info(f' ===> {kind}: {_summarize_names(names)}')
 
-		with KISYM_TEMPLATE.open('r') as tmpl:
-			template = env.from_string(''.join(tmpl.readlines()))
+	return True
 
-		symfile = template.render(
-			name     = cellib.stem,
-			lef_file = cellib.name,
-			symbols  = cells
-		)
+# The extra profiles for `--cprofile` when it's on. Before Python 3.12 a profile only covers the thread that
+# enabled it, so each pipeline thread runs its own and they're merged in with the main one at the end.
+_cprofiles: list | None = None
 
-		log.debug(f' ==> Writing to \'{KISYM_LIB}\'')
-		with KISYM_LIB.open('w') as sym:
-			sym.write(symfile)
-			sym.write('\n')
+def _thread_profile():
+	if _cprofiles is None or sys.version_info >= (3, 12):
+		return None
 
-	return True
+	import cProfile
+	prof = cProfile.Profile()
+	prof.enable()
+	return prof
+
+def _pipeline(items: Iterable) -> Iterator:
+	'''
+	Run the given stage in a background thread, handing everything it yields over through a bounded queue.
+
+	This lets the stages overlap with each other, while the size of the queue caps how far ahead
+	of the next stage it can get, and with that how many libraries are held in memory at once.
+	'''
+
+	queue = Queue(maxsize = PIPELINE_DEPTH)
+	done = object()
+
+	def _produce() -> None:
+		err = None
+		prof = _thread_profile()
+		try:
+			for item in items:
+				queue.put((item, None))
+		except BaseException as e:
+			err = e
+		finally:
+			if prof is not None:
+				prof.disable()
+				_cprofiles.append(prof)
+		queue.put((done, err))
+
+	Thread(target = _produce, daemon = True).start()
+
+	while True:
+		item, err = queue.get()
+		if item is done:
+			if err is not None:
+				raise err
+			return
+		yield item
+
+def generate_pdk(args: Namespace) -> bool:
+	log.info(f'Generating KiCad symbol libraries for PDK {args.pdk}')
+	log.info('This might take some time...')
 
-def main():
-	traceback.install()
-	_setup_logging()
+	sub_times = dict()
+
+	_start = datetime.utcnow()
+
+	with profiler.stage(args.pdk, 'collect'):
+		inventory = scan_pdk(args, ( 'lef', 'spice' ) if args.spice else ( 'lef', ))
+		lefs = collect_lefs(args, inventory) if inventory is not None else None
+	if lefs is None:
+		log.error('PDK had no LEF files, aborting')
+		return False
+
+	# The SPICE models are indexed up front, so each cell library can be merged as soon as it's parsed
+	subckts = dict()
+	if args.spice:
+		_spice_start = datetime.utcnow()
+		log.info('Indexing SPICE models...')
+		with profiler.stage(args.pdk, 'collect'):
+			spices = collect_spice(args, inventory)
+		subckts = build_subckt_index(process_spices(args, spices))
 
+		sub_times['spice'] = datetime.utcnow() - _spice_start
+	else:
+		log.warning('Skipping SPICE merge')
+
+	# Each stage runs in its own thread, and hands every cell library on to the next one as soon
+	# as it's done with it, so rendering and writing overlaps with parsing the remaining libraries.
+	_symlib_start = datetime.utcnow()
+	cellibs = _pipeline(process_lefs(args, lefs))
+	if args.spice:
+		cellibs = _pipeline(merge_spice(args, cellibs, subckts))
+	res = emit_symlibs(args, cellibs)
+
+	sub_times['symlib'] = datetime.utcnow() - _symlib_start
+
+	_end = datetime.utcnow()
+
+	log.info(f'Total Runtime: {_end - _start}')
+	if args.spice:
+		log.info(f' => SPICE Indexing: {sub_times["spice"]}')
+	log.info(f' => Cell Library ingestion and Symbol library generation: {sub_times["symlib"]}')
+	log.info(f' => Stages: {profiler.stage_summary(args.pdk)}')
+	if (caches := profiler.cache_summary(args.pdk)) != '':
+		log.info(f' => Caches: {caches}')
+	if (errors := profiler.parse_error_summary(args.pdk)) != '':
+		log.warning(f' => {errors}, see the log above or the `--profile-out` report for where')
+
+	if res:
+		log.info(f'Run complete, KiCad symbol library for {args.pdk} generated.')
+	else:
+		log.error(f'Unable to generate KiCad symbol library for {args.pdk}')
+
+	return res
+
+def build_arg_parser() -> ArgumentParser:
 	parser = ArgumentParser(
 		prog            = 'pdk2kicad',
 		description     = 'Generate KiCad symbol libraries from an open_pdk PDK',
@@ -917,6 +2775,12 @@ def main():
 		help   = 'Enable verbose output'
 	)
 
+	core_options.add_argument(
+		'--quiet', '-q',
+		action = 'store_true',
+		help   = 'Only output warnings and errors'
+	)
+
 	core_options.add_argument(
 		'--outdir', '-o',
 		type    = Path,
@@ -927,14 +2791,75 @@ def main():
 	core_options.add_argument(
 		'--skip-existing', '-S',
 		action = 'store_true',
-		help   = 'Skip ingestion and parsing of a LEF file if the .kicad_sym file already exists'
+		help   = 'Skip ingestion and parsing of a LEF file if its inputs haven\'t changed since the .kicad_sym was generated'
+	)
+
+	core_options.add_argument(
+		'--only-changed',
+		action = 'store_true',
+		help   = 'Only replace symbol libraries that have actually changed, and summarize which symbols changed in them'
 	)
 
 	core_options.add_argument(
 		'--jobs', '-j',
 		type    = int,
 		default = 1,
-		help    = 'Number of independant threads to run'
+		help    = 'Number of parallel jobs to run, see `--pool` for whether they are processes or threads'
+	)
+
+	core_options.add_argument(
+		'--pool',
+		type    = str,
+		choices = ( 'process', 'thread' ),
+		default = 'process',
+		help    = 'The kind of worker pool to use when running with more than one job'
+	)
+
+	core_options.add_argument(
+		'--cache-dir',
+		type    = Path,
+		default = CACHE_DIR,
+		help    = 'Directory to cache the compiled LEF parser and other intermediates in'
+	)
+
+	core_options.add_argument(
+		'--no-cache',
+		action = 'store_const',
+		const  = None,
+		dest   = 'cache_dir',
+		help   = 'Don\'t read or write any on-disk caches'
+	)
+
+	core_options.add_argument(
+		'--profile-out',
+		type    = Path,
+		default = None,
+		help    = 'Write a JSON report with per-library and per-stage timings, counts, and peak memory use'
+	)
+
+	core_options.add_argument(
+		'--cprofile',
+		type    = Path,
+		default = None,
+		help    = 'Run under cProfile and dump the stats to the given file, only covers the main process'
+	)
+
+	parsing_options.add_argument(
+		'--parser',
+		type    = str,
+		choices = ( 'fast', 'tatsu', 'tokens' ),
+		default = 'tatsu',
+		help    = (
+			'The LEF parser to use, `fast` only looks at the bits of the LEF we need and skips the geometry, '
+			'`tokens` is the TatSu parser with a grammar that matches whole tokens rather than single characters'
+		)
+	)
+
+	parsing_options.add_argument(
+		'--cross-check',
+		action  = 'store_true',
+		default = False,
+		help    = 'Run both LEF parsers and report any differences in the extracted cells'
 	)
 
 	parsing_options.add_argument(
@@ -966,12 +2891,10 @@ def main():
 	pdk_options.add_argument(
 		'--pdk', '-p',
 		type     = str,
-		choices  = (
-			'sky130A', 'sky130B',
-			'gf180mcuA', 'gf180mcuB', 'gf180mcuC', 'gf180mcuD'
-		),
-		default  = 'sky130B',
-		help     = 'The PDK to generate the KiCad libraries for.'
+		nargs    = '+',
+		choices  = ( *PDKS, 'all' ),
+		default  = [ 'sky130B' ],
+		help     = 'The PDK(s) to generate the KiCad libraries for, `all` will generate every PDK.'
 	)
 
 	pdk_options.add_argument(
@@ -981,6 +2904,42 @@ def main():
 		help    = 'Skip libraries with \'sram\' in the name, might improve speed.'
 	)
 
+	pdk_options.add_argument(
+		'--libs',
+		type    = str,
+		nargs   = '+',
+		metavar = 'GLOB',
+		default = None,
+		help    = 'Only generate the cell libraries whose names match one of the given globs, e.g. `\'*_sc_hd\'`'
+	)
+
+	pdk_options.add_argument(
+		'--skip-libs',
+		type    = str,
+		nargs   = '+',
+		metavar = 'GLOB',
+		default = None,
+		help    = 'Skip any cell libraries whose names match one of the given globs'
+	)
+
+	pdk_options.add_argument(
+		'--cells',
+		type    = str,
+		nargs   = '+',
+		metavar = 'GLOB',
+		default = None,
+		help    = 'Only generate the cells whose MACRO names match one of the given globs, e.g. `\'*__a21o_*\'`'
+	)
+
+	pdk_options.add_argument(
+		'--skip-cells',
+		type    = str,
+		nargs   = '+',
+		metavar = 'GLOB',
+		default = None,
+		help    = 'Skip any cells whose MACRO names match one of the given globs'
+	)
+
 	symbol_options.add_argument(
 		'--flatten', '-f',
 		action  = 'store_true',
@@ -1002,6 +2961,28 @@ def main():
 		help    = 'Don\'t discard symbols with no pins'
 	)
 
+	symbol_options.add_argument(
+		'--backend',
+		type    = str,
+		choices = ( 'jinja', 'sexpr' ),
+		default = 'jinja',
+		help    = 'How to generate the symbols, `sexpr` emits them directly rather than going through the templates'
+	)
+
+	symbol_options.add_argument(
+		'--extends',
+		action  = 'store_true',
+		default = False,
+		help    = 'Emit cells with the same pins as an earlier cell, such as other drive strengths, using `extends`'
+	)
+
+	symbol_options.add_argument(
+		'--compact',
+		action  = 'store_true',
+		default = False,
+		help    = 'Emit each symbol on a single line rather than pretty-printing them (sexpr backend only)'
+	)
+
 	spice_options.add_argument(
 		'--spice',
 		action  = 'store_true',
@@ -1016,7 +2997,13 @@ def main():
 		help    = 'Rather than linking the SPICE subckt model into the symbol, embed it.'
 	)
 
-	args = parser.parse_args()
+	return parser
+
+def main():
+	traceback.install()
+	_setup_logging()
+
+	args = build_arg_parser().parse_args()
 	_setup_logging(args)
 
 	if args.pdk_root is None:
@@ -1027,58 +3014,66 @@ def main():
 		log.error(f'PDK_ROOT {args.pdk_root} does not exist!')
 		return 1
 
-	log.info(f'Generating KiCad symbol libraries for PDK {args.pdk}')
-	log.info('This might take some time...')
-
-	sub_times = dict()
-
-	_start = datetime.utcnow()
-
-	_lef_start = datetime.utcnow()
-
-	lefs = collect_lefs(args)
-	if lefs is None:
-		log.error('PDK had no LEF files, aborting')
-		return 1
-
-	cells = process_lefs(args, lefs)
-
-	sub_times['lef'] = datetime.utcnow() - _lef_start
-
-	if args.spice:
-		_spice_start = datetime.utcnow()
-		log.info('Preforming SPICE merge...')
-		spices = collect_spice(args)
-		spicelibs = process_spices(args, spices)
-
-		merge_spice(args, cells, spicelibs)
-
-		sub_times['spice'] = datetime.utcnow() - _spice_start
+	setup_templates(args)
 
+	if 'all' in args.pdk:
+		available = [ pdk for pdk in PDKS if (args.pdk_root / pdk / 'libs.ref').exists() ]
+		for pdk in PDKS:
+			if pdk not in available:
+				log.warning(f'PDK {pdk} is not in PDK_ROOT: {args.pdk_root}, skipping')
 	else:
-		log.warning('Skipping SPICE merge')
-
-	_symlib_start = datetime.utcnow()
-	res = emit_symlibs(args, cells)
+		available = list()
 
-	sub_times['symlib'] = datetime.utcnow() - _symlib_start
+	pdks: list[str] = list(dict.fromkeys(
+		pdk for name in args.pdk for pdk in (available if name == 'all' else (name,))
+	))
 
-	_end = datetime.utcnow()
+	if len(pdks) == 0:
+		log.error(f'None of the known PDKs are in PDK_ROOT: {args.pdk_root}, nothing to generate')
+		return 1
 
-	log.info(f'Total Runtime: {_end - _start}')
-	log.info(f' => Cell Library ingestion: {sub_times["lef"]}')
-	if args.spice:
-		log.info(f' => SPICE Merge: {sub_times["spice"]}')
-	log.info(f' => Symbol library generating: {sub_times["symlib"]}')
+	if len(pdks) > 1:
+		global _parse_memo
+		_parse_memo = dict()
+		log.info(f'Generating KiCad symbol libraries for {len(pdks)} PDKs: {", ".join(pdks)}')
 
-	if res:
-		log.info(f'Run complete, KiCad symbol library for {args.pdk} generated.')
-		return 0
-	else:
-		log.error(f'Unable to generate KiCad symbol library for {args.pdk}')
+	_start = datetime.utcnow()
+	failed = list()
+
+	cprofile = None
+	if args.cprofile is not None:
+		import cProfile
+		global _cprofiles
+		_cprofiles = list()
+		cprofile = cProfile.Profile()
+		cprofile.enable()
+
+	for pdk in pdks:
+		pdk_args = Namespace(**vars(args))
+		pdk_args.pdk = pdk
+		if not generate_pdk(pdk_args):
+			failed.append(pdk)
+
+	if cprofile is not None:
+		cprofile.disable()
+		log.info(f'Writing cProfile stats to \'{args.cprofile}\'')
+		import pstats
+		pstats.Stats(cprofile, *_cprofiles).dump_stats(args.cprofile)
+
+	if len(pdks) > 1:
+		log.info(f'Generated {len(pdks) - len(failed)} of {len(pdks)} PDKs in {datetime.utcnow() - _start}')
+
+	if args.profile_out is not None:
+		log.info(f'Writing profiling report to \'{args.profile_out}\'')
+		with args.profile_out.open('w') as f:
+			json.dump(profiler.report(), f, indent = '\t')
+			f.write('\n')
+
+	if len(failed) > 0:
+		log.error(f'Unable to generate KiCad symbol libraries for: {", ".join(failed)}')
 		return 1
 
-
+	return 0
 
 
 if __name__ == '__main__':
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+import logging          as log
+from argparse           import ArgumentParser, ArgumentDefaultsHelpFormatter, Namespace
+from pathlib            import Path
+from datetime           import datetime
+from statistics         import median
+from tempfile           import TemporaryDirectory
+from time               import perf_counter
+
+import sys
+import json
+import random
+import platform
+import subprocess
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+import tatsu
+
+import pdk2kicad
+
+# The stages of pdk2kicad we time, in the order they are run
+STAGES = (
+	'scan_pdk', 'collect_lefs', 'process_lefs', 'collect_spice', 'process_spices', 'merge_spice', 'emit_symlibs'
+)
+
+BENCH_PDK = 'sky130A'
+
+LEF_HEADER = (
+	'VERSION 5.7 ;\nNOWIREEXTENSIONATPIN ON ;\nDIVIDERCHAR "/" ;\nBUSBITCHARS "[]" ;\n'
+	'UNITS\n  DATABASE MICRONS 1000 ;\nEND UNITS\n'
+)
+
+
+def _pin_names(pins: int) -> list[tuple[str, str, str]]:
+	''' The (name, direction, use) for each pin of a synthetic cell, always has power, ground, and one output '''
+	names = [
+		('VPWR', 'INOUT',  'POWER'),
+		('VGND', 'INOUT',  'GROUND'),
+		('X',    'OUTPUT', 'SIGNAL'),
+	]
+
+	for idx in range(max(pins - len(names), 0)):
+		names.append((f'A{idx}', 'INPUT', 'CLOCK' if idx == 0 and pins > 8 else 'SIGNAL'))
+
+	return names[:max(pins, 1)]
+
+def _rect(rng: random.Random) -> str:
+	x0 = round(rng.uniform(0, 5), 3)
+	y0 = round(rng.uniform(0, 2.5), 3)
+	return f'RECT {x0:.6f} {y0:.6f} {x0 + rng.uniform(0.1, 1):.6f} {y0 + rng.uniform(0.1, 1):.6f} ;'
+
+def gen_lef(library: str, macros: int, pins: int, rng: random.Random) -> str:
+	lef = [ LEF_HEADER ]
+
+	for idx in range(macros):
+		name = f'{library}__cell{idx}_1'
+		lef.append(
+			f'MACRO {name}\n  CLASS CORE ;\n  FOREIGN {name} ;\n  ORIGIN 0.000000 0.000000 ;\n'
+			f'  SIZE {rng.uniform(1, 20):.6f} BY 2.720000 ;\n  SYMMETRY X Y R90 ;\n  SITE unithd ;\n'
+		)
+
+		for pin, direction, use in _pin_names(pins):
+			lef.append(
+				f'  PIN {pin}\n    ANTENNAGATEAREA 0.126000 ;\n    DIRECTION {direction} ;\n    USE {use} ;\n'
+				'    PORT\n      LAYER li1 ;\n'
+			)
+			lef.extend(f'        {_rect(rng)}\n' for _ in range(rng.randint(1, 4)))
+			lef.append('      LAYER met1 ;\n')
+			lef.extend(f'        {_rect(rng)}\n' for _ in range(rng.randint(1, 3)))
+			lef.append(f'    END\n  END {pin}\n')
+
+		lef.append('  OBS\n    LAYER li1 ;\n')
+		lef.extend(f'      {_rect(rng)}\n' for _ in range(rng.randint(4, 16)))
+		lef.append(
+			'      POLYGON 0.000000 0.000000 1.000000 0.000000 1.000000 1.000000 '
+			'0.500000 1.500000 0.000000 1.000000 ;\n'
+			'    LAYER met1 ;\n'
+		)
+		lef.extend(f'      {_rect(rng)}\n' for _ in range(rng.randint(2, 8)))
+		lef.append(f'  END\nEND {name}\n')
+
+	lef.append('END LIBRARY\n')
+	return ''.join(lef)
+
+def gen_spice(library: str, macros: int, pins: int, rng: random.Random) -> str:
+	spice = [ f'* Synthetic netlist for {library}\n\n' ]
+
+	for idx in range(macros):
+		name = f'{library}__cell{idx}_1'
+		ports = ' '.join(pin for pin, _, _ in _pin_names(pins))
+		spice.append(f'* Cell: {name}\n.subckt {name} {ports} VNB VPB\n')
+		for dev in range(rng.randint(4, 24)):
+			fet = 'nfet_01v8' if dev % 2 else 'pfet_01v8_hvt'
+			spice.append(
+				f'X{dev} a_{dev}_{idx} A0 VPWR VPB sky130_fd_pr__{fet} w={rng.randint(420, 1000)}000u l=150000u\n'
+			)
+		spice.append('.ends\n\n')
+
+	return ''.join(spice)
+
+def gen_pdk(root: Path, libraries: int, macros: int, pins: int, seed: int) -> Path:
+	''' Lay out a fake PDK_ROOT/<pdk>/libs.ref tree with the given number of synthetic libraries '''
+	rng = random.Random(seed)
+	REFLIB = (root / BENCH_PDK / 'libs.ref')
+
+	for idx in range(libraries):
+		library = f'sky130_bench_sc_{idx}'
+		for kind in ('lef', 'spice'):
+			(REFLIB / library / kind).mkdir(parents = True, exist_ok = True)
+
+		(REFLIB / library / 'lef' / f'{library}.lef').write_text(gen_lef(library, macros, pins, rng))
+		(REFLIB / library / 'spice' / f'{library}.spice').write_text(gen_spice(library, macros, pins, rng))
+
+	return root
+
+def _git_commit() -> str | None:
+	try:
+		return subprocess.run(
+			[ 'git', 'rev-parse', '--short', 'HEAD' ], capture_output = True, text = True,
+			cwd = Path(__file__).parent, check = True
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def run_once(args: Namespace) -> dict[str, float]:
+	times = dict()
+
+	# Only the compiled parser is kept between runs, otherwise everything after
+	# the first run would come straight out of the MACRO database and SPICE index
+	if args.cache_dir is not None:
+		(args.cache_dir / pdk2kicad.MACRO_DB_NAME).unlink(missing_ok = True)
+		for index in args.cache_dir.glob('spice-*.pickle'):
+			index.unlink()
+
+	# Likewise the in-memory layout and fragment caches, or every run after the first would start out warm
+	for layout in pdk2kicad._layout_cache.values():
+		layout.fragments.clear()
+	pdk2kicad._layout_cache.clear()
+
+	def _timed(stage: str, fn, *fn_args):
+		start = perf_counter()
+		res = fn(*fn_args)
+		times[stage] = perf_counter() - start
+		return res
+
+	# The LEF and merge stages are generators, so each one is run to completion before the next
+	# rather than being pipelined like they are in pdk2kicad, otherwise they couldn't be timed separately.
+	inventory = _timed('scan_pdk',       pdk2kicad.scan_pdk,       args)
+	lefs      = _timed('collect_lefs',   pdk2kicad.collect_lefs,   args, inventory)
+	cellibs   = _timed('process_lefs',   list, pdk2kicad.process_lefs(args, lefs))
+	spices    = _timed('collect_spice',  pdk2kicad.collect_spice,  args, inventory)
+	spicelibs = _timed('process_spices', pdk2kicad.process_spices, args, spices)
+	subckts   = pdk2kicad.build_subckt_index(spicelibs)
+	cellibs   = _timed('merge_spice',    list, pdk2kicad.merge_spice(args, cellibs, subckts))
+	_timed('emit_symlibs', pdk2kicad.emit_symlibs, args, cellibs)
+
+	return times
+
+def _report(results: dict, baseline: dict | None) -> None:
+	header = f'{"stage":<16} {"min (s)":>10} {"median (s)":>12}'
+	if baseline is not None:
+		header += f' {"baseline (s)":>14} {"change":>8}'
+	print(header)
+	for stage in STAGES:
+		res = results['stages'][stage]
+		line = f'{stage:<16} {res["min"]:>10.4f} {res["median"]:>12.4f}'
+		if baseline is not None and stage in baseline['stages']:
+			old = baseline['stages'][stage]['min']
+			line += f' {old:>14.4f} {((res["min"] - old) / old * 100) if old > 0 else 0:>+7.1f}%'
+		print(line)
+
+	if results['peak_rss_kib'] is not None:
+		line = f'{"peak RSS (MiB)":<16} {results["peak_rss_kib"] / 1024:>10.1f}'
+		if baseline is not None and baseline.get('peak_rss_kib', None):
+			old = baseline['peak_rss_kib']
+			line += f' {"":>12} {old / 1024:>14.1f} {(results["peak_rss_kib"] - old) / old * 100:>+7.1f}%'
+		print(line)
+
+def main() -> int:
+	parser = ArgumentParser(
+		prog            = 'pdk2kicad_bench',
+		description     = 'Benchmark pdk2kicad against a synthetic PDK',
+		formatter_class = ArgumentDefaultsHelpFormatter
+	)
+
+	parser.add_argument('--libraries', '-l', type = int, default = 2,   help = 'Number of synthetic cell libraries')
+	parser.add_argument('--macros',    '-m', type = int, default = 200, help = 'Number of MACROs per library')
+	parser.add_argument('--pins',      '-n', type = int, default = 6,   help = 'Number of pins per MACRO')
+	parser.add_argument('--seed',            type = int, default = 0,   help = 'Seed for the fixture generator')
+	parser.add_argument('--repeat',    '-r', type = int, default = 3,   help = 'Number of timed runs')
+
+	parser.add_argument(
+		'--workdir', '-w',
+		type    = Path,
+		default = None,
+		help    = 'Where to generate the fixtures and output, defaults to a temporary directory'
+	)
+
+	parser.add_argument(
+		'--json',
+		type    = Path,
+		default = None,
+		help    = 'Write the results to the given JSON file'
+	)
+
+	parser.add_argument(
+		'--compare',
+		type    = Path,
+		default = None,
+		help    = 'A JSON file from a previous run to compare the results against'
+	)
+
+	parser.add_argument(
+		'pdk2kicad_args',
+		nargs   = '*',
+		help    = 'Extra options to pass through to pdk2kicad, after a `--` (e.g. `-- --parser fast -j 4`)'
+	)
+
+	bench_args = parser.parse_args()
+	pdk2kicad._setup_logging()
+	log.getLogger().setLevel(log.WARNING)
+
+	with TemporaryDirectory(prefix = 'pdk2kicad-bench-') as tmp:
+		WORKDIR = bench_args.workdir if bench_args.workdir is not None else Path(tmp)
+		PDK_ROOT = (WORKDIR / 'pdk')
+
+		print(
+			f'Generating {bench_args.libraries} libraries of {bench_args.macros} macros '
+			f'with {bench_args.pins} pins in \'{WORKDIR}\''
+		)
+		gen_pdk(PDK_ROOT, bench_args.libraries, bench_args.macros, bench_args.pins, bench_args.seed)
+
+		# `--quiet` is passed through to the pool workers too, which set up their own logging
+		args = pdk2kicad.build_arg_parser().parse_args([
+			'--pdk-root', str(PDK_ROOT), '--pdk', BENCH_PDK, '--outdir', str(WORKDIR / 'symbols'),
+			'--cache-dir', str(WORKDIR / 'cache'), '--spice', '--quiet', *bench_args.pdk2kicad_args
+		])
+		args.pdk = BENCH_PDK
+		pdk2kicad.setup_templates(args)
+
+		# Make sure the parser is compiled and cached before we start timing anything
+		pdk2kicad.load_lef_model(args)
+
+		runs = list()
+		for idx in range(bench_args.repeat):
+			runs.append(run_once(args))
+			print(f'Run {idx + 1}/{bench_args.repeat}: {sum(runs[-1].values()):.4f}s')
+
+	results = {
+		'meta': {
+			'generated': datetime.utcnow().isoformat(),
+			'commit':    _git_commit(),
+			'python':    platform.python_version(),
+			'tatsu':     tatsu.__version__,
+			'fixture': {
+				'libraries': bench_args.libraries,
+				'macros':    bench_args.macros,
+				'pins':      bench_args.pins,
+				'seed':      bench_args.seed,
+			},
+			'args':      bench_args.pdk2kicad_args,
+		},
+		# ru_maxrss is in KiB on Linux, this covers the fixture generation too but that's only ever one library at a time
+		'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None,
+		'stages': {
+			stage: {
+				'min':    min(run[stage] for run in runs),
+				'median': median(run[stage] for run in runs),
+				'runs':   [ run[stage] for run in runs ],
+			} for stage in STAGES
+		}
+	}
+
+	baseline = None
+	if bench_args.compare is not None:
+		with bench_args.compare.open('r') as f:
+			baseline = json.load(f)
+		if baseline['meta']['fixture'] != results['meta']['fixture']:
+			log.warning('The baseline was run against a different fixture, the comparison may be meaningless')
+
+	_report(results, baseline)
+
+	if bench_args.json is not None:
+		with bench_args.json.open('w') as f:
+			json.dump(results, f, indent = '\t')
+			f.write('\n')
+
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())